@@ -1,52 +1,154 @@
 from __future__ import annotations
 
-from pathlib import Path
+import os
+import re
+from dataclasses import dataclass, fields
+from typing import TYPE_CHECKING, Any, Callable
 
-from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# PGN_DATALENS_ROOT pins the repo root for packaged installs; otherwise derive it from this
+# file without resolving symlinks.
+_REPO_ROOT = os.environ.get("PGN_DATALENS_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_BACKEND_DIR = os.path.join(_REPO_ROOT, "backend")
+_ENV_CANDIDATES = [os.path.join(_REPO_ROOT, ".env"), os.path.join(_BACKEND_DIR, ".env")]
+_ENV_HINT = " or ".join(_ENV_CANDIDATES)
 
-_BACKEND_DIR = Path(__file__).resolve().parent
-_REPO_ROOT = _BACKEND_DIR.parent
-_ENV_CANDIDATES = [str(_REPO_ROOT / ".env"), str(_BACKEND_DIR / ".env")]
 
-
-class Settings(BaseSettings):
+@dataclass(frozen=True, slots=True)
+class Settings:
     supabase_url: str = ""
     supabase_anon_key: str = ""
     supabase_service_role_key: str = ""
     supabase_bucket: str = "project-documents"
     signed_url_expires_seconds: int = 3600
-
-    model_config = SettingsConfigDict(env_file=_ENV_CANDIDATES, extra="ignore")
-
-
-settings = Settings()
-
-
-def _raise_missing(missing: list[str]) -> None:
+    cors_allow_origins: str = "*"
+
+
+# The subset of python-dotenv's syntax .env files here rely on: `export` prefixes, quoted values
+# (anything after the closing quote is ignored) and ` # comment` after an unquoted value.
+_QUOTED_VALUE = re.compile(r"'([^']*)'|\"((?:\\.|[^\"\\])*)\"")
+_INLINE_COMMENT = re.compile(r"\s+#.*$")
+_DOUBLE_QUOTE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+
+
+def _parse_env_value(value: str) -> str:
+    quoted = _QUOTED_VALUE.match(value)
+    if quoted is None:
+        return _INLINE_COMMENT.sub("", value)
+    if quoted.group(1) is not None:
+        return quoted.group(1)
+    return re.sub(r"\\(.)", lambda m: _DOUBLE_QUOTE_ESCAPES.get(m.group(1), m.group(1)), quoted.group(2))
+
+
+def _read_env_file(path: str) -> dict[str, str]:
+    try:
+        f = open(path, encoding="utf-8")
+    except OSError:
+        return {}
+    out: dict[str, str] = {}
+    with f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("export "):
+                line = line[7:].lstrip()
+            key, sep, value = line.partition("=")
+            if not sep:
+                continue
+            out[key.strip().lower()] = _parse_env_value(value.strip())
+    return out
+
+
+def _load_settings() -> Settings:
+    # Same precedence as pydantic-settings: later env files override earlier ones,
+    # process environment overrides both, names are case-insensitive.
+    values: dict[str, str] = {}
+    for path in _ENV_CANDIDATES:
+        if os.path.isfile(path):
+            values.update(_read_env_file(path))
+    values.update((k.lower(), v) for k, v in os.environ.items())
+
+    kwargs: dict[str, object] = {}
+    for f in fields(Settings):
+        raw = values.get(f.name)
+        if raw is None:
+            continue
+        kwargs[f.name] = int(raw) if f.type in (int, "int") else raw
+    return Settings(**kwargs)
+
+
+def _missing_message(required: tuple[tuple[str, str], ...]) -> str | None:
+    missing = [name for name, value in required if not value]
     if not missing:
-        return
-    env_hint = " or ".join(_ENV_CANDIDATES)
-    raise RuntimeError(f"Missing env: {', '.join(missing)}. Define them in {env_hint}")
-
-
-def require_supabase_url() -> None:
-    _raise_missing(["SUPABASE_URL"] if not settings.supabase_url else [])
-
-
-def require_supabase_anon() -> None:
-    missing: list[str] = []
-    if not settings.supabase_url:
-        missing.append("SUPABASE_URL")
-    if not settings.supabase_anon_key:
-        missing.append("SUPABASE_ANON_KEY")
-    _raise_missing(missing)
-
-
-def require_supabase_service() -> None:
-    missing: list[str] = []
-    if not settings.supabase_url:
-        missing.append("SUPABASE_URL")
-    if not settings.supabase_service_role_key:
-        missing.append("SUPABASE_SERVICE_ROLE_KEY")
-    _raise_missing(missing)
+        return None
+    return f"Missing env: {', '.join(missing)}. Define them in {_ENV_HINT}"
+
+
+def _noop() -> None:
+    return None
+
+
+def _require(message: str | None) -> Callable[[], None]:
+    if message is None:
+        return _noop
+
+    def _raise() -> None:
+        raise RuntimeError(message)
+
+    return _raise
+
+
+_REQUIRED: dict[str, tuple[tuple[str, str], ...]] = {
+    "require_supabase_url": (("SUPABASE_URL", "supabase_url"),),
+    "require_supabase_anon": (
+        ("SUPABASE_URL", "supabase_url"),
+        ("SUPABASE_ANON_KEY", "supabase_anon_key"),
+    ),
+    "require_supabase_service": (
+        ("SUPABASE_URL", "supabase_url"),
+        ("SUPABASE_SERVICE_ROLE_KEY", "supabase_service_role_key"),
+    ),
+}
+
+
+def _resolve(name: str) -> Any:
+    # Settings and the require_* checks are built on first access and then cached as real
+    # module globals, so `from .app_settings import settings` pays the .env parsing only
+    # when something actually needs it. The checks are bound once: importers copy the name,
+    # so rebinding them later would never reach db.py/main.py.
+    cached = globals().get(name)
+    if cached is not None:
+        return cached
+    if name == "settings":
+        value: Any = _load_settings()
+    elif name in _REQUIRED:
+        current = _resolve("settings")
+        value = _require(
+            _missing_message(tuple((env, getattr(current, attr)) for env, attr in _REQUIRED[name]))
+        )
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+if TYPE_CHECKING:
+    settings: Settings
+    require_supabase_url: Callable[[], None]
+    require_supabase_anon: Callable[[], None]
+    require_supabase_service: Callable[[], None]
+
+
+def __getattr__(name: str) -> Any:
+    return _resolve(name)
+
+
+def validate_settings_at_startup() -> list[str]:
+    problems: list[str] = []
+    for name in ("require_supabase_anon", "require_supabase_service"):
+        try:
+            _resolve(name)()
+        except RuntimeError as e:
+            problems.append(str(e))
+    return problems
@@ -1,13 +1,193 @@
-from supabase import Client, create_client
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, cast
+from uuid import UUID
+
+from fastapi import HTTPException
 
 from .app_settings import require_supabase_anon, require_supabase_service, settings
 
+if TYPE_CHECKING:
+    from supabase import AsyncClient, Client
+
+
+_lock = threading.Lock()
+_anon: Client | None = None
+_svc: Client | None = None
+
+# Async clients are bound to the event loop that created them, so they are cached per loop.
+_anon_async: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient] = weakref.WeakKeyDictionary()
+_svc_async: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient] = weakref.WeakKeyDictionary()
+_async_locks: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = weakref.WeakKeyDictionary()
+
+
+def _close_sessions(client: Client | None) -> None:
+    # Only sub-clients that were actually built hold an httpx session; the public properties
+    # would create them just to close them.
+    if client is None:
+        return
+    for sub in (getattr(client, "_postgrest", None), getattr(client, "_storage", None)):
+        if sub is None:
+            continue
+        try:
+            sub.aclose()
+        except Exception:
+            pass
+
 
 def get_supabase_anon() -> Client:
-    require_supabase_anon()
-    return create_client(settings.supabase_url, settings.supabase_anon_key)
+    global _anon
+    client = _anon
+    if client is not None:
+        return client
+    with _lock:
+        if _anon is None:
+            require_supabase_anon()
+            from supabase import ClientOptions, create_client
+
+            # Shared across requests: never keep or auto-refresh a user session on it.
+            # Published only once fully built, so the lock-free read above never sees a partial client.
+            _anon = create_client(
+                settings.supabase_url,
+                settings.supabase_anon_key,
+                options=ClientOptions(auto_refresh_token=False, persist_session=False),
+            )
+        return _anon
 
 
 def get_supabase_service() -> Client:
-    require_supabase_service()
-    return create_client(settings.supabase_url, settings.supabase_service_role_key)
+    global _svc
+    client = _svc
+    if client is not None:
+        return client
+    with _lock:
+        if _svc is None:
+            require_supabase_service()
+            from supabase import create_client
+
+            _svc = create_client(settings.supabase_url, settings.supabase_service_role_key)
+        return _svc
+
+
+def close_clients() -> None:
+    global _anon, _svc
+    with _lock:
+        anon, svc = _anon, _svc
+        _anon = None
+        _svc = None
+    _close_sessions(anon)
+    _close_sessions(svc)
+
+
+async def _get_async_client(
+    cache: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncClient],
+    factory: Callable[[], Awaitable[AsyncClient]],
+) -> AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = cache.get(loop)
+    if client is not None:
+        return client
+    lock = _async_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        client = cache.get(loop)
+        if client is None:
+            client = await factory()
+            cache[loop] = client
+    return client
+
+
+async def get_supabase_anon_async() -> AsyncClient:
+    async def _create() -> AsyncClient:
+        require_supabase_anon()
+        from supabase import AsyncClientOptions, acreate_client
+
+        return await acreate_client(
+            settings.supabase_url,
+            settings.supabase_anon_key,
+            options=AsyncClientOptions(auto_refresh_token=False, persist_session=False),
+        )
+
+    return await _get_async_client(_anon_async, _create)
+
+
+async def get_supabase_service_async() -> AsyncClient:
+    async def _create() -> AsyncClient:
+        require_supabase_service()
+        from supabase import acreate_client
+
+        return await acreate_client(settings.supabase_url, settings.supabase_service_role_key)
+
+    return await _get_async_client(_svc_async, _create)
+
+
+# Bulk inserts (OCR/MTO rows) need thousands of ids; drawing them from one urandom read
+# per batch replaces a getrandom() syscall per id.
+_ID_BATCH = 256
+_id_pool: deque[str] = deque()
+_id_lock = threading.Lock()
+
+
+def new_id() -> str:
+    try:
+        return _id_pool.popleft()
+    except IndexError:
+        pass
+    with _id_lock:
+        while True:
+            try:
+                return _id_pool.popleft()
+            except IndexError:
+                blob = os.urandom(16 * _ID_BATCH)
+                _id_pool.extend(str(UUID(bytes=blob[i : i + 16], version=4)) for i in range(0, len(blob), 16))
+
+
+def new_ids(n: int) -> list[str]:
+    # Loops that know their row count up front take one urandom read sized to the batch.
+    blob = os.urandom(16 * n)
+    return [str(UUID(bytes=blob[i : i + 16], version=4)) for i in range(0, len(blob), 16)]
+
+
+# A forked worker must never hand out ids already drawn by its parent.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_id_pool.clear)
+
+
+INSERT_CHUNK_SIZE = 500
+# Separate from the app's I/O pool so scripts get the helpers without importing backend.main.
+_insert_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="pgn_insert")
+
+
+# For writes whose result is never read: PostgREST answers 201/204 without echoing the rows.
+RETURN_MINIMAL = cast(Any, "minimal")
+
+
+def insert_chunk(svc, table: str, chunk: list[dict[str, Any]], failure: str) -> int:
+    # A minimal return has an empty body, which postgrest-py reports as count=0; the insert is
+    # all-or-nothing and execute() raises on failure, so a successful call stored every row.
+    res = svc.table(table).insert(chunk, returning=RETURN_MINIMAL).execute()
+    if res is None:
+        raise HTTPException(status_code=500, detail=failure)
+    return len(chunk)
+
+
+def submit_insert_chunks(
+    svc, table: str, rows: list[dict[str, Any]], failure: str = "Gagal menyimpan material"
+) -> list[Future[int]]:
+    # Large inserts go in slices, sent concurrently on their own pool, without PostgREST echoing
+    # every row back. Never call this from an _insert_pool worker.
+    return [
+        _insert_pool.submit(insert_chunk, svc, table, rows[start : start + INSERT_CHUNK_SIZE], failure)
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE)
+    ]
+
+
+def insert_rows_minimal(svc, table: str, rows: list[dict[str, Any]], failure: str = "Gagal menyimpan material") -> int:
+    if len(rows) <= INSERT_CHUNK_SIZE:
+        return insert_chunk(svc, table, rows, failure) if rows else 0
+    return sum(job.result() for job in submit_insert_chunks(svc, table, rows, failure))
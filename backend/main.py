@@ -1,23 +1,49 @@
 from __future__ import annotations
 
+import multiprocessing
 import os
+import re
 import logging
 import hashlib
 import csv
 import io
-from datetime import datetime
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-from typing import Any, cast
-from uuid import uuid4
+from typing import Any, Callable, TypeVar, cast
 
-from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
+from anyio import to_thread
+from fastapi import BackgroundTasks, Depends, FastAPI, File, Form, HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from fastapi.staticfiles import StaticFiles
-
-from .app_settings import require_supabase_anon, require_supabase_service, settings
-from .db import get_supabase_anon, get_supabase_service
+from pydantic import TypeAdapter
+
+from .app_settings import settings, validate_settings_at_startup
+from .db import (
+    RETURN_MINIMAL,
+    close_clients,
+    get_supabase_anon,
+    get_supabase_service,
+    insert_rows_minimal,
+    new_id,
+    new_ids,
+    submit_insert_chunks,
+)
+from .ttl_cache import TTLCache
 from .schemas import (
     AuthRequest,
     AuthSession,
@@ -36,32 +62,158 @@ from .schemas import (
     ProjectWithSummary,
 )
 from .services.extraction import (
+    MTO_COLUMNS,
     build_extracted_json,
+    call_with_file_bytes,
     extract_pdf_text,
     extract_mto_from_pdf_bytes_advanced,
     extract_mto_from_image_bytes_advanced,
     convert_image_bytes_to_pdf,
     detect_upload_kind,
     ocr_pdf_text,
+    open_pdf,
+    parse_bbox,
     parse_doc_info,
     parse_materials,
     parse_materials_from_pdf_bytes,
     validate_and_convert_image_upload,
     _try_import_pytesseract,
+    warm_ocr_worker,
 )
 
 
-app = FastAPI(title="PGN DataLens", version="0.1.0")
-security = HTTPBearer(auto_error=False)
 logger = logging.getLogger("pgn_datalens")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=False,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# Sync endpoints and run_in_threadpool share anyio's default limiter (40 threads); every
+# handler blocks on Supabase round-trips, so allow more of them in flight.
+THREADPOOL_SIZE = int(os.getenv("PGN_DATALENS_THREADPOOL_SIZE") or 64)
+
+# Lets a sync handler overlap independent Supabase round-trips.
+_io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="pgn_io")
+
+# PDF parsing and OCR are CPU-bound; with THREADPOOL_SIZE handlers in flight they would
+# oversubscribe the cores and starve the cheap endpoints, so only this many run at once.
+CPU_WORKERS = int(os.getenv("PGN_DATALENS_CPU_WORKERS") or min(8, os.cpu_count() or 1))
+_cpu_slots = threading.BoundedSemaphore(CPU_WORKERS)
+
+T = TypeVar("T")
+
+
+def _cpu_bound(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    with _cpu_slots:
+        return fn(*args, **kwargs)
+
+
+# MTO OCR runs in worker processes: page rendering and token parsing hold the GIL, and
+# PyMuPDF is not thread-safe. Started on first use with spawn, since forking a process full
+# of threads is unsafe. PGN_DATALENS_OCR_PROCESSES=0 keeps OCR on the calling thread.
+OCR_PROCESSES = int(os.getenv("PGN_DATALENS_OCR_PROCESSES") or CPU_WORKERS)
+# Larger inputs reach the workers through a temp file rather than a pickled copy.
+OCR_INLINE_BYTES = 4 * 1024 * 1024
+_proc_pool: ProcessPoolExecutor | None = None
+_proc_pool_lock = threading.Lock()
+
+
+def _get_proc_pool() -> ProcessPoolExecutor:
+    global _proc_pool
+    with _proc_pool_lock:
+        if _proc_pool is None:
+            _proc_pool = ProcessPoolExecutor(
+                max_workers=OCR_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_ocr_worker,
+            )
+        return _proc_pool
+
+
+def _shutdown_proc_pool() -> None:
+    global _proc_pool
+    with _proc_pool_lock:
+        if _proc_pool is not None:
+            _proc_pool.shutdown(wait=False, cancel_futures=True)
+            _proc_pool = None
+
+
+@contextmanager
+def _spilled(raw: bytes, suffix: str = ".bin"):
+    path = os.path.join(tempfile.gettempdir(), f"pgn_ocr_{new_id()}{suffix}")
+    with open(path, "wb") as f:
+        f.write(raw)
+    try:
+        yield path
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _ocr_call(fn: Callable[..., T], raw: bytes, *args: Any, **kwargs: Any) -> T:
+    if OCR_PROCESSES <= 0:
+        return _cpu_bound(fn, raw, *args, **kwargs)
+    pool = _get_proc_pool()
+    try:
+        if len(raw) <= OCR_INLINE_BYTES:
+            return pool.submit(fn, raw, *args, **kwargs).result()
+        with _spilled(raw) as path:
+            return pool.submit(call_with_file_bytes, fn, path, *args, **kwargs).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM on a huge page); start a fresh pool for the next request.
+        _shutdown_proc_pool()
+        raise
+
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Surface misconfiguration at boot; the app still starts so /api/health can report it.
+    problems = validate_settings_at_startup()
+    for problem in problems:
+        logger.error(problem)
+    if not problems:
+        try:
+            await run_in_threadpool(_ensure_storage_bucket, get_supabase_service())
+        except Exception:
+            # Retried lazily by the storage endpoints.
+            pass
+    # Probe `tesseract --version` off the request path; the first MTO import would pay for it.
+    _io_pool.submit(_tesseract_engine_version)
+    yield
+    _mto_job_pool.shutdown(wait=False, cancel_futures=True)
+    _shutdown_proc_pool()
+    close_clients()
+
+
+def _default_response_class() -> type[JSONResponse]:
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return JSONResponse
+    return ORJSONResponse
+
+
+_ResponseClass = _default_response_class()
+
+app = FastAPI(
+    title="PGN DataLens",
+    version="0.1.0",
+    lifespan=_lifespan,
+    default_response_class=_ResponseClass,
 )
+security = HTTPBearer(auto_error=False)
+
+# The UI is served from this app, so CORS only matters for other origins. An empty
+# CORS_ALLOW_ORIGINS drops the middleware (e.g. when a reverse proxy answers preflights).
+_cors_origins = [o.strip() for o in settings.cors_allow_origins.split(",") if o.strip()]
+if _cors_origins:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=_cors_origins,
+        allow_credentials=False,
+        allow_methods=["GET", "POST", "PATCH", "DELETE"],
+        allow_headers=["Authorization", "Content-Type"],
+        max_age=86400,
+    )
 
 
 FRONTEND_DIR = (Path(__file__).parent.parent / "frontend").resolve()
@@ -69,10 +221,20 @@ if FRONTEND_DIR.exists():
     app.mount("/static", StaticFiles(directory=str(FRONTEND_DIR)), name="static")
 
 
+# Validated bearer tokens -> user id, so a burst of requests costs one get_user round-trip.
+# A revoked token can keep working for at most AUTH_CACHE_TTL_SECONDS.
+AUTH_CACHE_TTL_SECONDS = 60.0
+_auth_cache: TTLCache[bytes, str] = TTLCache(maxsize=10_000, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
 def _require_auth(creds: HTTPAuthorizationCredentials | None = Depends(security)) -> str:
     if creds is None or not creds.credentials:
         raise HTTPException(status_code=401, detail="Missing bearer token")
     token = creds.credentials
+    cache_key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    cached = _auth_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
         anon = get_supabase_anon()
     except RuntimeError as e:
@@ -83,17 +245,51 @@ def _require_auth(creds: HTTPAuthorizationCredentials | None = Depends(security)
         raise HTTPException(status_code=401, detail="Invalid token")
     if user is None or user.user is None or not getattr(user.user, "id", None):
         raise HTTPException(status_code=401, detail="Invalid token")
-    return str(user.user.id)
+    user_id = str(user.user.id)
+    _auth_cache.set(cache_key, user_id)
+    return user_id
+
+
+def _normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def _email_fingerprint(email: str, *, normalized: bool = False) -> str:
+    norm = email if normalized else _normalize_email(email)
+    return hashlib.blake2b(norm.encode("utf-8"), digest_size=6).hexdigest()
+
+
+# Availability checks fire while the user types. Only "registered" answers are remembered:
+# an address never stops being taken, while a cached "free" could hide a sign-up handled by
+# another worker or created from the dashboard.
+_email_exists_cache: TTLCache[str, bool] = TTLCache(maxsize=10_000, ttl=60.0)
+
+
+def _remember_registered_email(fp: str) -> None:
+    _email_exists_cache.set(fp, True)
 
 
-def _email_fingerprint(email: str) -> str:
-    norm = (email or "").strip().lower()
-    return hashlib.sha256(norm.encode("utf-8")).hexdigest()[:12]
+def _email_exists(email: str, email_fp: str | None = None) -> bool:
+    target = _normalize_email(email)
+    fp = email_fp or _email_fingerprint(target, normalized=True)
+    if _email_exists_cache.get(fp):
+        return True
+    exists = _lookup_email_exists(target)
+    if exists:
+        _remember_registered_email(fp)
+    return exists
 
 
-def _email_exists(email: str) -> bool:
+def _lookup_email_exists(target: str) -> bool:
     svc = get_supabase_service()
-    target = (email or "").strip().lower()
+    try:
+        res = svc.rpc("email_exists", {"p_email": target}).execute()
+        if isinstance(res.data, bool):
+            return res.data
+    except Exception:
+        logger.debug("email_exists_rpc_unavailable", exc_info=True)
+
+    # Fallback for databases without migration 0008: scan the user directory.
     page = 1
     per_page = 200
     while True:
@@ -109,6 +305,18 @@ def _email_exists(email: str) -> bool:
         page += 1
 
 
+_DUPLICATE_USER_CODES = frozenset({"email_exists", "user_already_exists"})
+_DUPLICATE_USER_RE = re.compile(r"already\s+(?:been\s+)?registered", re.IGNORECASE)
+
+
+def _is_duplicate_user_error(e: Exception, msg: str) -> bool:
+    # GoTrue reports duplicates with a stable error code (422/409); the message match is only
+    # for older servers that send none.
+    if getattr(e, "code", None) in _DUPLICATE_USER_CODES or getattr(e, "status", None) == 409:
+        return True
+    return _DUPLICATE_USER_RE.search(msg) is not None
+
+
 def _duplicate_email_http() -> HTTPException:
     return HTTPException(
         status_code=409,
@@ -128,8 +336,46 @@ def _storage_file_options(content_type: str) -> dict[str, str]:
     return {"content-type": content_type}
 
 
+# Writes within the same millisecond share one formatted timestamp; a tuple swap is atomic,
+# so threads never observe a stamp paired with the wrong millisecond.
+_now_iso_cache: tuple[int, str] = (-1, "")
+
+
 def _utc_now_iso() -> str:
-    return datetime.utcnow().isoformat()
+    global _now_iso_cache
+    ms = time.time_ns() // 1_000_000
+    cached = _now_iso_cache
+    if cached[0] == ms:
+        return cached[1]
+    stamp = datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat(timespec="milliseconds")
+    _now_iso_cache = (ms, stamp)
+    return stamp
+
+
+_PG_UNIQUE_VIOLATION = "23505"
+# Postgres undefined_column, and PostgREST's "column not in the schema cache" for inserts.
+_MISSING_COLUMN_CODES = frozenset({"42703", "PGRST204"})
+# Postgres undefined_function, and PostgREST's "function not in the schema cache". Only these mean the
+# migration with the RPC is not applied; any other error may come after the function already committed.
+_MISSING_FUNCTION_CODES = frozenset({"42883", "PGRST202"})
+
+
+def _replace_document_materials(
+    svc, document_id: str, user_id: str, rows: list[dict[str, Any]], data_source: str | None = None
+) -> int | None:
+    # Delete + insert in one transaction (migration 0014), so readers never see the document
+    # without materials. None means the RPC is unavailable and the caller should fall back.
+    try:
+        res = svc.rpc(
+            "replace_document_materials",
+            {"p_document": document_id, "p_owner": user_id, "p_source": data_source, "p_rows": rows},
+        ).execute()
+    except Exception as e:
+        if getattr(e, "code", None) not in _MISSING_FUNCTION_CODES:
+            raise
+        logger.debug("replace_document_materials_rpc_unavailable", exc_info=True)
+        return None
+    return res.data if isinstance(res.data, int) else len(rows)
 
 
 def _insert_item_revision(
@@ -147,7 +393,7 @@ def _insert_item_revision(
     ocr_extraction_id: str | None = None,
 ) -> None:
     row = {
-        "id": str(uuid4()),
+        "id": new_id(),
         "owner_id": owner_id,
         "project_id": project_id,
         "document_id": document_id,
@@ -160,26 +406,37 @@ def _insert_item_revision(
         "changed_by": changed_by,
         "changed_at": _utc_now_iso(),
     }
-    svc.table("item_revisions").insert(row).execute()
+    svc.table("item_revisions").insert(row, returning=RETURN_MINIMAL).execute()
+
+
+# Material fields snapshotted into item_revisions, and the subset a review may patch.
+REVISION_FIELDS = ("description", "spec", "size", "quantity", "unit", "verification_status", "needs_review")
+REVIEW_PATCH_FIELDS = ("description", "spec", "size", "quantity", "unit")
+SMALL_LENGTH_UNITS = frozenset({"mm", "cm"})
+
+
+# `tesseract --version` is a subprocess per call and cannot change while the process runs. Only a
+# successful probe is remembered: a missing binary or a failed spawn is retried on the next call.
+_tesseract_version: str | None = None
 
 
 def _tesseract_engine_version() -> str | None:
+    global _tesseract_version
+    if _tesseract_version is not None:
+        return _tesseract_version
     p = _try_import_pytesseract()
     if p is None:
         return None
     try:
-        return str(p.get_tesseract_version())
+        _tesseract_version = str(p.get_tesseract_version())
     except Exception:
+        logger.debug("tesseract_version_unavailable", exc_info=True)
         return None
+    return _tesseract_version
 
 
-def _mto_row_to_material_fields(row: dict[str, Any]) -> tuple[dict[str, Any], list[str]]:
-    raw_desc = str(row.get("description") or "").strip()
-    raw_mat = str(row.get("material") or "").strip()
-    raw_nps = str(row.get("nps") or "").strip()
-    qty = row.get("qty_value")
-    unit = str(row.get("qty_unit") or "").strip()
-
+@lru_cache(maxsize=4096)
+def _mto_text_fields(raw_desc: str, raw_mat: str, raw_nps: str, unit: str) -> tuple[str, str | None, str | None, str | None, tuple[str, ...]]:
     name = raw_desc or raw_mat
     spec_parts: list[str] = []
     if raw_mat and raw_mat != name:
@@ -200,42 +457,66 @@ def _mto_row_to_material_fields(row: dict[str, Any]) -> tuple[dict[str, Any], li
     if size and size.isdigit():
         size = f"{size} Inch"
 
+    unit_out = unit or None
+    flags: list[str] = []
+    if unit_out is None:
+        flags.append("missing_unit")
+    if size is None:
+        flags.append("missing_size")
+    if unit_out is not None and len(unit_out) > 8:
+        flags.append("unit_suspicious")
+    if unit_out is not None and size is not None and "inch" in size.lower() and unit_out.lower() in SMALL_LENGTH_UNITS:
+        flags.append("unit_size_mismatch")
+    return name or "", spec, size, unit_out, tuple(flags)
+
+
+def _mto_row_to_material_fields(row: dict[str, Any]) -> tuple[dict[str, Any], list[str]]:
+    # MTO tables repeat the same description/material/NPS/unit combinations across many
+    # rows, so the string normalisation is memoised and only the quantity is per row.
+    name, spec, size, unit, text_flags = _mto_text_fields(
+        str(row.get("description") or "").strip(),
+        str(row.get("material") or "").strip(),
+        str(row.get("nps") or "").strip(),
+        str(row.get("qty_unit") or "").strip(),
+    )
+    qty = row.get("qty_value")
     out = {
-        "description": name or "",
+        "description": name,
         "spec": spec,
         "size": size,
         "quantity": float(qty) if qty is not None else None,
-        "unit": unit or None,
+        "unit": unit,
     }
 
     flags: list[str] = []
-    if not out["description"]:
+    if not name:
         flags.append("missing_description")
     if out["quantity"] is None:
         flags.append("missing_quantity")
-    if out["unit"] is None:
-        flags.append("missing_unit")
-    if out["size"] is None:
-        flags.append("missing_size")
-    if out["unit"] is not None and len(out["unit"]) > 8:
-        flags.append("unit_suspicious")
-    if out["unit"] is not None and out["size"] is not None and "inch" in str(out["size"]).lower() and str(out["unit"]).lower() in ["mm", "cm"]:
-        flags.append("unit_size_mismatch")
+    flags.extend(text_flags)
     return out, flags
 
 
+_buckets_ready: set[str] = set()
+_bucket_lock = threading.Lock()
+
+
 def _ensure_storage_bucket(svc) -> None:
     bucket_id = settings.supabase_bucket
-    try:
-        buckets = svc.storage.list_buckets()
-        for b in buckets:
-            if getattr(b, "id", None) == bucket_id:
-                return
-        svc.storage.create_bucket(bucket_id, options={"public": False})
-        logger.info("storage_bucket: created", extra={"bucket": bucket_id})
-    except Exception as e:
-        logger.error("storage_bucket: ensure failed", extra={"bucket": bucket_id, "error": str(e)})
-        raise
+    if bucket_id in _buckets_ready:
+        return
+    with _bucket_lock:
+        if bucket_id in _buckets_ready:
+            return
+        try:
+            buckets = svc.storage.list_buckets()
+            if not any(getattr(b, "id", None) == bucket_id for b in buckets):
+                svc.storage.create_bucket(bucket_id, options={"public": False})
+                logger.info("storage_bucket: created", extra={"bucket": bucket_id})
+        except Exception as e:
+            logger.error("storage_bucket: ensure failed", extra={"bucket": bucket_id, "error": str(e)})
+            raise
+        _buckets_ready.add(bucket_id)
 
 
 @app.get("/")
@@ -246,17 +527,25 @@ def serve_index():
     return JSONResponse({"ok": True, "message": "Frontend belum dibuat"})
 
 
+# Probes hit /api/health several times a second; the Supabase check is reused briefly.
+HEALTH_CACHE_SECONDS = 5.0
+_health_cache: tuple[float, dict[str, Any]] | None = None
+
+
+@app.get("/api/health/live")
+def health_live():
+    return {"ok": True}
+
+
 @app.get("/api/health")
 def health_check():
-    missing: list[str] = []
-    try:
-        require_supabase_anon()
-    except RuntimeError as e:
-        missing.append(str(e))
-    try:
-        require_supabase_service()
-    except RuntimeError as e:
-        missing.append(str(e))
+    global _health_cache
+    cached = _health_cache
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < HEALTH_CACHE_SECONDS:
+        return cached[1]
+
+    missing = validate_settings_at_startup()
 
     try:
         svc = get_supabase_service()
@@ -266,7 +555,9 @@ def health_check():
     except Exception as e:
         missing.append(f"Supabase Storage check failed: {e}")
 
-    return {"ok": len(missing) == 0, "checks": missing}
+    result = {"ok": len(missing) == 0, "checks": missing}
+    _health_cache = (now, result)
+    return result
 
 
 @app.post("/api/auth/sign-up", response_model=AuthSession)
@@ -278,7 +569,7 @@ def sign_up(payload: AuthRequest):
 
     email_fp = _email_fingerprint(payload.email)
     try:
-        if _email_exists(payload.email):
+        if _email_exists(payload.email, email_fp):
             logger.info("sign_up: duplicate_email", extra={"email_fp": email_fp})
             raise _duplicate_email_http()
     except HTTPException:
@@ -297,14 +588,16 @@ def sign_up(payload: AuthRequest):
         )
     except Exception as e:
         msg = str(e)
-        if "already been registered" in msg.lower() or "already registered" in msg.lower():
+        if _is_duplicate_user_error(e, msg):
             logger.info("sign_up: duplicate_email (create_user)", extra={"email_fp": email_fp})
+            _remember_registered_email(email_fp)
             raise _duplicate_email_http()
         raise HTTPException(status_code=400, detail=msg)
 
     user_id = getattr(created.user, "id", None) if created is not None else None
     if not user_id:
         raise HTTPException(status_code=400, detail="Sign up gagal: user tidak tersedia")
+    _remember_registered_email(email_fp)
 
     try:
         login = anon.auth.sign_in_with_password({"email": payload.email, "password": payload.password})
@@ -333,7 +626,7 @@ def email_availability(email: str):
     if not norm or "@" not in norm:
         raise HTTPException(status_code=400, detail="Email tidak valid")
     try:
-        exists = _email_exists(norm)
+        exists = _email_exists(norm, email_fp)
     except Exception as e:
         logger.warning("email_availability: failed", extra={"email_fp": email_fp, "error": str(e)})
         raise HTTPException(status_code=500, detail="Gagal memeriksa email")
@@ -382,68 +675,90 @@ def me(user_id: str = Depends(_require_auth)):
     return MeResponse(user_id=user_id)
 
 
-@app.get("/api/projects", response_model=list[ProjectWithSummary])
-def list_projects(user_id: str = Depends(_require_auth)):
-    svc = get_supabase_service()
+LENGTH_UNITS = frozenset({"m", "meter", "meters"})
 
-    p = svc.table("projects").select("*").eq("owner_id", user_id).order("updated_at", desc=True).execute()
-    if p is None:
-        raise HTTPException(status_code=500, detail="Gagal mengambil proyek")
-    projects: list[dict[str, Any]] = p.data or []
 
-    docs_by_project: dict[str, int] = {}
-    mats_by_project: dict[str, int] = {}
+def _project_summaries(svc, user_id: str) -> dict[str, dict[str, Any]]:
+    try:
+        res = svc.rpc("project_summaries", {"p_owner": user_id}).execute()
+        if res is not None and isinstance(res.data, list):
+            return {str(r["project_id"]): r for r in res.data if r.get("project_id")}
+    except Exception:
+        logger.debug("project_summaries_rpc_unavailable", exc_info=True)
 
-    docs_res = svc.table("documents").select("project_id").eq("owner_id", user_id).execute()
+    # Fallback for databases without migration 0009: aggregate the rows here.
+    docs_job = _io_pool.submit(lambda: svc.table("documents").select("project_id").eq("owner_id", user_id).execute())
+    mats_res = svc.table("materials").select("project_id", "quantity", "unit").eq("owner_id", user_id).execute()
+    docs_res = docs_job.result()
     if docs_res is None:
         raise HTTPException(status_code=500, detail="Gagal mengambil dokumen")
-    docs = docs_res.data or []
-    for d in docs:
-        pid = d.get("project_id")
-        if pid:
-            docs_by_project[pid] = docs_by_project.get(pid, 0) + 1
-
-    mats_res = svc.table("materials").select("project_id", "quantity", "unit").eq("owner_id", user_id).execute()
     if mats_res is None:
         raise HTTPException(status_code=500, detail="Gagal mengambil material")
-    mats = mats_res.data or []
-    for m in mats:
-        pid = m.get("project_id")
-        if pid:
-            mats_by_project[pid] = mats_by_project.get(pid, 0) + 1
 
-    pipe_len_by_project: dict[str, float] = {}
-    for m in mats:
+    # One [documents, material rows, pipe length] accumulator per project, so each row
+    # touches a single hash bucket.
+    totals: defaultdict[str, list[Any]] = defaultdict(lambda: [0, 0, 0.0])
+    for d in docs_res.data or []:
+        pid = d.get("project_id")
+        if pid:
+            totals[pid][0] += 1
+    for m in mats_res.data or []:
         pid = m.get("project_id")
         if not pid:
             continue
-        unit = (m.get("unit") or "").lower()
+        acc = totals[pid]
+        acc[1] += 1
         qty = m.get("quantity")
-        if qty is None:
-            continue
-        if unit in ["m", "meter", "meters"]:
-            pipe_len_by_project[pid] = pipe_len_by_project.get(pid, 0.0) + float(qty)
+        if qty is not None and (m.get("unit") or "").lower() in LENGTH_UNITS:
+            acc[2] += float(qty)
+
+    return {
+        pid: {"total_documents": n_docs, "total_material_rows": n_mats, "total_pipe_length_m": length}
+        for pid, (n_docs, n_mats, length) in totals.items()
+    }
+
+
+# Response payloads are validated and encoded by pydantic-core in one pass each, straight to
+# JSON bytes; response_model stays on the routes for the OpenAPI schema only.
+_PROJECT_LIST: TypeAdapter[list[ProjectWithSummary]] = TypeAdapter(list[ProjectWithSummary])
+_DOCUMENT: TypeAdapter[Document] = TypeAdapter(Document)
+_DOCUMENT_LIST: TypeAdapter[list[Document]] = TypeAdapter(list[Document])
+_MATERIAL_LIST: TypeAdapter[list[Material]] = TypeAdapter(list[Material])
+_MATERIAL_PAGE: TypeAdapter[MaterialListResponse] = TypeAdapter(MaterialListResponse)
+
+
+def _validated_json(adapter: TypeAdapter[Any], data: Any) -> Response:
+    return Response(content=adapter.dump_json(adapter.validate_python(data)), media_type="application/json")
+
+
+@app.get("/api/projects", response_model=list[ProjectWithSummary])
+def list_projects(user_id: str = Depends(_require_auth)):
+    svc = get_supabase_service()
+
+    # Only leaf queries go to the pool: _project_summaries may submit its own fallback queries.
+    projects_job = _io_pool.submit(
+        lambda: svc.table("projects").select("*").eq("owner_id", user_id).order("updated_at", desc=True).execute()
+    )
+    summaries = _project_summaries(svc, user_id)
+    p = projects_job.result()
+    if p is None:
+        raise HTTPException(status_code=500, detail="Gagal mengambil proyek")
+    projects: list[dict[str, Any]] = p.data or []
 
-    out: list[ProjectWithSummary] = []
     for pr in projects:
-        pid = pr["id"]
-        out.append(
-            ProjectWithSummary(
-                **pr,
-                total_documents=docs_by_project.get(pid, 0),
-                total_material_rows=mats_by_project.get(pid, 0),
-                total_pipe_length_m=pipe_len_by_project.get(pid, 0.0),
-            )
-        )
-    return out
+        summary = summaries.get(pr["id"]) or {}
+        pr["total_documents"] = int(summary.get("total_documents") or 0)
+        pr["total_material_rows"] = int(summary.get("total_material_rows") or 0)
+        pr["total_pipe_length_m"] = float(summary.get("total_pipe_length_m") or 0.0)
+    return _validated_json(_PROJECT_LIST, projects)
 
 
 @app.post("/api/projects", response_model=Project)
 def create_project(payload: ProjectCreate, user_id: str = Depends(_require_auth)):
     svc = get_supabase_service()
-    now = datetime.utcnow().isoformat()
+    now = _utc_now_iso()
     row = {
-        "id": str(uuid4()),
+        "id": new_id(),
         "owner_id": user_id,
         "name": payload.name,
         "location": payload.location,
@@ -478,7 +793,7 @@ def update_project(project_id: str, payload: ProjectUpdate, user_id: str = Depen
     patch = payload.model_dump(exclude_none=True)
     if not patch:
         raise HTTPException(status_code=400, detail="Tidak ada perubahan")
-    patch["updated_at"] = datetime.utcnow().isoformat()
+    patch["updated_at"] = _utc_now_iso()
     res = (
         svc.table("projects")
         .update(patch)
@@ -502,6 +817,59 @@ def delete_project(project_id: str, user_id: str = Depends(_require_auth)):
     return {"deleted": len(res.data or [])}
 
 
+# Signed URLs are reused for half their lifetime, so repeated listings skip signing entirely.
+_signed_url_cache: TTLCache[str, str] = TTLCache(
+    maxsize=50_000, ttl=max(1, settings.signed_url_expires_seconds // 2)
+)
+
+
+def _sign_new_object(storage, path: str) -> str | None:
+    # Right after an upload: the URL is cached so the next document listing reuses it.
+    try:
+        url = storage.create_signed_url(path, settings.signed_url_expires_seconds).get("signedURL")
+    except Exception:
+        return None
+    if url:
+        _signed_url_cache.set(path, url)
+    return url
+
+
+def _signed_urls(storage, paths: list[str]) -> dict[str, str | None]:
+    out: dict[str, str | None] = {}
+    missing: list[str] = []
+    for path in dict.fromkeys(paths):
+        url = _signed_url_cache.get(path)
+        if url is None:
+            missing.append(path)
+        else:
+            out[path] = url
+    if not missing:
+        return out
+
+    signed: dict[str, str | None] = {}
+    try:
+        for item in storage.create_signed_urls(missing, settings.signed_url_expires_seconds):
+            if item.get("path") and not item.get("error"):
+                signed[item["path"]] = item.get("signedURL")
+    except Exception:
+        logger.warning("signed_urls: batch signing failed, signing one by one", exc_info=True)
+        jobs = {
+            path: _io_pool.submit(storage.create_signed_url, path, settings.signed_url_expires_seconds)
+            for path in missing
+        }
+        for path, job in jobs.items():
+            try:
+                signed[path] = job.result().get("signedURL")
+            except Exception:
+                signed[path] = None
+
+    for path, url in signed.items():
+        if url:
+            _signed_url_cache.set(path, url)
+        out[path] = url
+    return out
+
+
 @app.get("/api/projects/{project_id}/documents", response_model=list[Document])
 def list_documents(project_id: str, user_id: str = Depends(_require_auth)):
     svc = get_supabase_service()
@@ -519,44 +887,89 @@ def list_documents(project_id: str, user_id: str = Depends(_require_auth)):
 
     _ensure_storage_bucket(svc)
     storage = svc.storage.from_(settings.supabase_bucket)
-    out: list[Document] = []
+    signed_by_path = _signed_urls(storage, [d["storage_path"] for d in docs if d.get("storage_path")])
     for d in docs:
-        download_url = None
-        try:
-            signed = storage.create_signed_url(d["storage_path"], settings.signed_url_expires_seconds)
-            download_url = signed.get("signedURL")
-        except Exception:
-            download_url = None
-        d["download_url"] = download_url
-        out.append(Document(**d))
-    return out
+        d["download_url"] = signed_by_path.get(d["storage_path"])
+    return _validated_json(_DOCUMENT_LIST, docs)
 
 
-@app.post("/api/projects/{project_id}/documents", response_model=Document)
-async def upload_document(project_id: str, file: UploadFile = File(...), user_id: str = Depends(_require_auth)):
-    filename_in = file.filename or ""
+_UPLOAD_SNIFF_BYTES = 8 * 1024
+_UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+# Matches Supabase Storage's default per-file limit, so oversized PDFs fail before the upload.
+UPLOAD_MAX_BYTES = int(os.getenv("PGN_DATALENS_UPLOAD_MAX_BYTES") or 50 * 1024 * 1024)
 
-    svc = get_supabase_service()
+
+def _upload_size(file: UploadFile) -> int:
+    size = file.file.seek(0, os.SEEK_END)
+    file.file.seek(0)
+    return size
+
+
+def _require_upload_size(size: int) -> None:
+    if size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Ukuran file melebihi {UPLOAD_MAX_BYTES // (1024 * 1024)}MB")
+
+
+def _upload_file_streaming(storage, storage_path: str, src, content_type: str) -> None:
+    # storage3 streams only real file objects (BufferedReader/FileIO), not the request's
+    # SpooledTemporaryFile. SpooledTemporaryFile.fileno() rolls an in-memory spool over to disk,
+    # so a reader over a dup of that descriptor is enough; sources without a descriptor are
+    # copied to a named temp file in chunks.
+    try:
+        fd = os.dup(src.fileno())
+    except (AttributeError, OSError):
+        fd = None
+    if fd is not None:
+        with os.fdopen(fd, "rb") as fh:
+            fh.seek(0)
+            storage.upload(storage_path, fh, cast(Any, _storage_file_options(content_type)))
+        return
+    with tempfile.NamedTemporaryFile(prefix="pgn_upload_", delete=False) as tmp:
+        shutil.copyfileobj(src, tmp, _UPLOAD_CHUNK_BYTES)
+        tmp_path = tmp.name
+    try:
+        with open(tmp_path, "rb") as fh:
+            storage.upload(storage_path, fh, cast(Any, _storage_file_options(content_type)))
+    finally:
+        os.unlink(tmp_path)
+
+
+def _require_project_owner(svc, project_id: str, user_id: str) -> None:
     pr = svc.table("projects").select("id").eq("id", project_id).eq("owner_id", user_id).limit(1).execute()
     if pr is None:
         raise HTTPException(status_code=500, detail="Gagal mengambil proyek")
     if not pr.data:
         raise HTTPException(status_code=404, detail="Proyek tidak ditemukan")
 
-    try:
-        content = await file.read()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Gagal membaca file")
 
+def _prepare_upload(file: UploadFile, project_id: str, user_id: str) -> tuple[bytes | None, dict[str, Any]]:
+    filename_in = file.filename or ""
     content_type_in = (file.content_type or "").lower() or None
 
+    # PDFs are recognised from their header and streamed to storage from disk; only images,
+    # which are re-encoded below, are read fully into memory.
+    content: bytes | None = None
     try:
-        kind = detect_upload_kind(content, filename=filename_in, content_type=content_type_in)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    doc_id = str(uuid4())
+        head = file.file.read(_UPLOAD_SNIFF_BYTES)
+        file.file.seek(0)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Gagal membaca file")
+    try:
+        kind = detect_upload_kind(head, filename=filename_in, content_type=content_type_in)
+    except ValueError:
+        kind = None
+    if kind != "pdf":
+        try:
+            content = file.file.read()
+        except Exception:
+            raise HTTPException(status_code=400, detail="Gagal membaca file")
+        try:
+            kind = detect_upload_kind(content, filename=filename_in, content_type=content_type_in)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    doc_id = new_id()
     original_filename = os.path.basename(filename_in) if filename_in else None
-    now = datetime.utcnow().isoformat()
+    now = _utc_now_iso()
 
     mime_type = "application/pdf"
     file_kind = "pdf"
@@ -588,9 +1001,13 @@ async def upload_document(project_id: str, file: UploadFile = File(...), user_id
             pdf_name = f"{pdf_name}.pdf"
         filename = pdf_name
         storage_path = f"{user_id}/{project_id}/{doc_id}/{filename}"
-        file_size_bytes = len(content)
+        if content is not None:
+            file_size_bytes = len(content)
+        else:
+            file_size_bytes = _upload_size(file)
+        _require_upload_size(file_size_bytes)
 
-    row = {
+    return content, {
         "id": doc_id,
         "project_id": project_id,
         "owner_id": user_id,
@@ -609,29 +1026,46 @@ async def upload_document(project_id: str, file: UploadFile = File(...), user_id
         "original_filename": original_filename,
     }
 
+
+@app.post("/api/projects/{project_id}/documents", response_model=Document)
+def upload_document(project_id: str, file: UploadFile = File(...), user_id: str = Depends(_require_auth)):
+    svc = get_supabase_service()
+    # The ownership check runs on the I/O pool while the file is sniffed and, for images,
+    # re-encoded; its verdict still wins over any file validation error.
+    project_check = _io_pool.submit(_require_project_owner, svc, project_id, user_id)
+    try:
+        prepared = _prepare_upload(file, project_id, user_id)
+    except HTTPException:
+        project_check.result()
+        raise
+    project_check.result()
+    content, row = prepared
+    storage_path = row["storage_path"]
+    mime_type = row["mime_type"]
+
     _ensure_storage_bucket(svc)
     storage = svc.storage.from_(settings.supabase_bucket)
     try:
-        storage.upload(storage_path, content, cast(Any, _storage_file_options(mime_type)))
+        if content is not None:
+            storage.upload(storage_path, content, cast(Any, _storage_file_options(mime_type)))
+        else:
+            _upload_file_streaming(storage, storage_path, file.file, mime_type)
     except Exception as e:
         msg = str(e)
         if "bucket not found" in msg.lower():
             raise HTTPException(status_code=500, detail=f"Storage bucket tidak ditemukan: {settings.supabase_bucket}")
         raise HTTPException(status_code=400, detail=f"Upload ke storage gagal: {e}")
 
+    # The object exists now, so it is signed while the metadata row is written.
+    signing = _io_pool.submit(_sign_new_object, storage, storage_path)
     ins = svc.table("documents").insert(row).execute()
     if ins is None:
         raise HTTPException(status_code=500, detail="Simpan metadata dokumen gagal")
     if not ins.data:
         raise HTTPException(status_code=400, detail="Simpan metadata dokumen gagal")
 
-    try:
-        signed = storage.create_signed_url(storage_path, settings.signed_url_expires_seconds)
-        row["download_url"] = signed.get("signedURL")
-    except Exception:
-        row["download_url"] = None
-
-    return Document(**row)
+    row["download_url"] = signing.result()
+    return _validated_json(_DOCUMENT, row)
 
 
 @app.delete("/api/documents/{document_id}")
@@ -650,8 +1084,10 @@ def delete_document(document_id: str, user_id: str = Depends(_require_auth)):
         storage.remove([storage_path])
     except Exception:
         pass
+    _drop_cached_document(storage_path)
+    _signed_url_cache.pop(storage_path)
 
-    svc.table("documents").delete().eq("id", document_id).eq("owner_id", user_id).execute()
+    svc.table("documents").delete(returning=RETURN_MINIMAL).eq("id", document_id).eq("owner_id", user_id).execute()
     return {"deleted": True}
 
 
@@ -674,7 +1110,17 @@ def list_materials(
     res = query.order("created_at", desc=True).execute()
     if res is None:
         raise HTTPException(status_code=500, detail="Gagal mengambil material")
-    return [Material(**m) for m in (res.data or [])]
+    return _validated_json(_MATERIAL_LIST, res.data or [])
+
+
+MATERIAL_SORT_COLUMNS = {
+    "created_at": "created_at",
+    "name": "description",
+    "description": "description",
+    "size": "size",
+    "quantity": "quantity",
+    "unit": "unit",
+}
 
 
 @app.get("/api/projects/{project_id}/materials/page", response_model=MaterialListResponse)
@@ -695,18 +1141,15 @@ def list_materials_page(
     limit = max(1, min(int(limit), 1000))
     offset = max(0, int(offset))
 
-    sort_map = {
-        "created_at": "created_at",
-        "name": "description",
-        "description": "description",
-        "size": "size",
-        "quantity": "quantity",
-        "unit": "unit",
-    }
-    col = sort_map.get((sort_by or "created_at").lower(), "created_at")
-    desc = (sort_dir or "desc").lower() != "asc"
+    col = MATERIAL_SORT_COLUMNS.get(sort_by.lower(), "created_at") if sort_by else "created_at"
+    desc = not (sort_dir and sort_dir.lower() == "asc")
 
-    query = svc.table("materials").select("*").eq("project_id", project_id).eq("owner_id", user_id)
+    query = (
+        svc.table("materials")
+        .select("*", count=cast(Any, "exact"))
+        .eq("project_id", project_id)
+        .eq("owner_id", user_id)
+    )
     if document_id:
         query = query.eq("document_id", document_id)
     if size:
@@ -722,32 +1165,41 @@ def list_materials_page(
 
     query = query.order(col, desc=desc)
     if hasattr(query, "range"):
-        res = query.range(offset, offset + limit).execute()
+        res = query.range(offset, offset + limit - 1).execute()
         if res is None:
             raise HTTPException(status_code=500, detail="Gagal mengambil material")
-        data = res.data or []
+        items = res.data or []
+        total = res.count
     else:
         res = query.execute()
         if res is None:
             raise HTTPException(status_code=500, detail="Gagal mengambil material")
-        data = (res.data or [])[offset : offset + limit + 1]
+        rows = res.data or []
+        items = rows[offset : offset + limit]
+        total = len(rows)
 
-    has_more = len(data) > limit
-    items = data[:limit]
-    next_offset = offset + limit if has_more else None
-    return {
-        "items": [Material(**m) for m in items],
-        "offset": offset,
-        "limit": limit,
-        "next_offset": next_offset,
-    }
+    # The exact count from Content-Range replaces fetching a phantom limit+1 row.
+    if total is not None:
+        has_more = offset + limit < total
+    else:
+        has_more = len(items) == limit
+    return _validated_json(
+        _MATERIAL_PAGE,
+        {
+            "items": items,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if has_more else None,
+            "total": total,
+        },
+    )
 
 
 @app.post("/api/projects/{project_id}/materials", response_model=Material)
 def create_material(project_id: str, payload: MaterialCreate, user_id: str = Depends(_require_auth)):
     svc = get_supabase_service()
     row = {
-        "id": str(uuid4()),
+        "id": new_id(),
         "owner_id": user_id,
         "project_id": project_id,
         "document_id": payload.document_id,
@@ -758,7 +1210,7 @@ def create_material(project_id: str, payload: MaterialCreate, user_id: str = Dep
         "heat_no": payload.heat_no,
         "tag_no": payload.tag_no,
         "spec": payload.spec,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": _utc_now_iso(),
     }
     res = svc.table("materials").insert(row).execute()
     if not res.data:
@@ -769,6 +1221,22 @@ def create_material(project_id: str, payload: MaterialCreate, user_id: str = Dep
 @app.patch("/api/materials/{material_id}", response_model=Material)
 def update_material(material_id: str, payload: MaterialUpdate, user_id: str = Depends(_require_auth)):
     svc = get_supabase_service()
+    patch = payload.model_dump(exclude_none=True)
+    if patch:
+        try:
+            edited = svc.rpc("edit_material", {"p_material": material_id, "p_owner": user_id, "p_patch": patch}).execute()
+            if isinstance(edited.data, list):
+                if not edited.data:
+                    raise HTTPException(status_code=404, detail="Material tidak ditemukan")
+                return edited.data[0]
+        except HTTPException:
+            raise
+        except Exception as e:
+            if getattr(e, "code", None) not in _MISSING_FUNCTION_CODES:
+                raise
+            logger.debug("edit_material_rpc_unavailable", exc_info=True)
+
+    # Fallback for databases without migration 0012 (and the empty-patch 404/400 ordering).
     existing = svc.table("materials").select("*").eq("id", material_id).eq("owner_id", user_id).limit(1).execute()
     if existing is None:
         raise HTTPException(status_code=500, detail="Gagal mengambil material")
@@ -776,7 +1244,6 @@ def update_material(material_id: str, payload: MaterialUpdate, user_id: str = De
         raise HTTPException(status_code=404, detail="Material tidak ditemukan")
 
     before = dict(existing.data[0])
-    patch = payload.model_dump(exclude_none=True)
     if not patch:
         raise HTTPException(status_code=400, detail="Tidak ada perubahan")
     res = svc.table("materials").update(patch).eq("id", material_id).eq("owner_id", user_id).execute()
@@ -794,8 +1261,8 @@ def update_material(material_id: str, payload: MaterialUpdate, user_id: str = De
             document_id=str(after.get("document_id") or before.get("document_id") or "") or None,
             material_id=material_id,
             change_source="manual_edit",
-            before={k: before.get(k) for k in ["description", "spec", "size", "quantity", "unit", "verification_status", "needs_review"]},
-            after={k: after.get(k) for k in ["description", "spec", "size", "quantity", "unit", "verification_status", "needs_review"]},
+            before={k: before.get(k) for k in REVISION_FIELDS},
+            after={k: after.get(k) for k in REVISION_FIELDS},
             changed_by=user_id,
             ocr_run_id=str(after.get("ocr_run_id") or "") or None,
             ocr_extraction_id=str(after.get("ocr_extraction_id") or "") or None,
@@ -831,24 +1298,30 @@ def material_ocr_context(material_id: str, user_id: str = Depends(_require_auth)
         raise HTTPException(status_code=404, detail="Material tidak ditemukan")
     mat = m.data[0]
 
-    run = None
-    ext = None
     run_id = str(mat.get("ocr_run_id") or "")
     ext_id = str(mat.get("ocr_extraction_id") or "")
 
-    if run_id:
-        r = svc.table("ocr_runs").select("*").eq("id", run_id).eq("owner_id", user_id).limit(1).execute()
-        run = (r.data[0] if (r is not None and r.data) else None)
-    if ext_id:
-        e = svc.table("ocr_item_extractions").select("*").eq("id", ext_id).eq("owner_id", user_id).limit(1).execute()
-        ext = (e.data[0] if (e is not None and e.data) else None)
+    def _first_owned(table: str, row_id: str) -> dict[str, Any] | None:
+        if not row_id:
+            return None
+        r = svc.table(table).select("*").eq("id", row_id).eq("owner_id", user_id).limit(1).execute()
+        return r.data[0] if (r is not None and r.data) else None
+
+    # The run and extraction lookups are independent; the run is fetched on the I/O pool.
+    run_job = _io_pool.submit(_first_owned, "ocr_runs", run_id) if run_id else None
+    ext = _first_owned("ocr_item_extractions", ext_id)
+    run = run_job.result() if run_job is not None else None
     return {"material": mat, "ocr_run": run, "ocr_extraction": ext}
 
 
 @app.post("/api/materials/{material_id}/review")
 async def review_material(material_id: str, request: Request, user_id: str = Depends(_require_auth)):
-    svc = get_supabase_service()
     body = await request.json()
+    return await run_in_threadpool(_review_material, material_id, body, user_id)
+
+
+def _review_material(material_id: str, body: Any, user_id: str) -> dict[str, Any]:
+    svc = get_supabase_service()
     decision = str((body or {}).get("decision") or "").strip().lower()
     notes = (body or {}).get("notes")
     patch_in = (body or {}).get("patch") or {}
@@ -863,7 +1336,7 @@ async def review_material(material_id: str, request: Request, user_id: str = Dep
 
     now = _utc_now_iso()
     patch: dict[str, Any] = {}
-    for k in ["description", "spec", "size", "quantity", "unit"]:
+    for k in REVIEW_PATCH_FIELDS:
         if k in patch_in:
             patch[k] = patch_in.get(k)
 
@@ -885,7 +1358,7 @@ async def review_material(material_id: str, request: Request, user_id: str = Dep
 
     svc.table("review_decisions").insert(
         {
-            "id": str(uuid4()),
+            "id": new_id(),
             "owner_id": user_id,
             "project_id": after.get("project_id"),
             "document_id": after.get("document_id"),
@@ -895,7 +1368,8 @@ async def review_material(material_id: str, request: Request, user_id: str = Dep
             "notes": notes,
             "decided_by": user_id,
             "decided_at": now,
-        }
+        },
+        returning=RETURN_MINIMAL,
     ).execute()
 
     try:
@@ -906,8 +1380,8 @@ async def review_material(material_id: str, request: Request, user_id: str = Dep
             document_id=str(after.get("document_id") or "") or None,
             material_id=material_id,
             change_source="ocr_verify" if decision == "approved" else "ocr_reject",
-            before={k: before.get(k) for k in ["description", "spec", "size", "quantity", "unit", "verification_status", "needs_review"]},
-            after={k: after.get(k) for k in ["description", "spec", "size", "quantity", "unit", "verification_status", "needs_review"]},
+            before={k: before.get(k) for k in REVISION_FIELDS},
+            after={k: after.get(k) for k in REVISION_FIELDS},
             changed_by=user_id,
             ocr_run_id=str(after.get("ocr_run_id") or "") or None,
             ocr_extraction_id=str(after.get("ocr_extraction_id") or "") or None,
@@ -970,137 +1444,220 @@ def list_extraction_runs(document_id: str, user_id: str = Depends(_require_auth)
 
 
 @app.post("/api/documents/{document_id}/extract", response_model=ExtractionResponse)
-async def extract_document(document_id: str, user_id: str = Depends(_require_auth)):
+def extract_document(
+    document_id: str,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    background: bool = False,
+    user_id: str = Depends(_require_auth),
+):
     svc = get_supabase_service()
-    doc = svc.table("documents").select("*").eq("id", document_id).eq("owner_id", user_id).limit(1).execute()
-    if doc is None:
-        raise HTTPException(status_code=500, detail="Gagal mengambil dokumen")
-    if not doc.data:
-        raise HTTPException(status_code=404, detail="Dokumen tidak ditemukan")
+    if not background:
+        claimed = _claim_document(svc, document_id, user_id, "extracting")
+        if claimed is not None:
+            try:
+                _require_pdf_document(claimed)
+            except HTTPException:
+                _set_document_status(svc, document_id, user_id, str(claimed.get("status") or "uploaded"))
+                raise
+            return _run_extraction(svc, claimed, document_id, user_id, new_id(), marked=True)
 
-    d = doc.data[0]
+    d = _require_doc_owner(svc, document_id, user_id)
+    _require_pdf_document(d)
+    if not background:
+        return _run_extraction(svc, d, document_id, user_id, new_id())
 
-    inferred_kind = (str(d.get("file_kind") or "").strip().lower() or None)
-    if inferred_kind is None:
-        sp = str(d.get("storage_path") or "")
-        fn = str(d.get("filename") or "")
-        if "/images/" in sp.replace("\\", "/") or fn.lower().endswith((".png", ".jpg", ".jpeg")):
-            inferred_kind = "image"
-        else:
-            inferred_kind = "pdf"
+    # ?background=true: record a queued run, answer 202 and let the client poll extraction-runs.
+    run_row = {
+        "id": new_id(),
+        "owner_id": user_id,
+        "document_id": document_id,
+        "method": "pdf_text",
+        "status": "queued",
+        "extracted_json": None,
+        "notes": None,
+        "created_at": _utc_now_iso(),
+    }
+    if svc.table("extraction_runs").insert(run_row).execute() is None:
+        raise HTTPException(status_code=500, detail="Gagal membuat antrean ekstraksi")
+    background_tasks.add_task(_run_extraction_in_background, d, document_id, user_id, run_row["id"])
+    response.status_code = 202
+    return {"run": run_row, "inserted_materials": 0}
 
-    if inferred_kind != "pdf":
-        raise HTTPException(
-            status_code=400,
-            detail=(
-                "Dokumen ini berupa gambar. Ekstraksi hanya tersedia untuk PDF. "
-                "Langkah yang bisa dilakukan: (1) jalankan OCR MTO untuk gambar via /api/documents/{id}/mto, "
-                "atau (2) konversi gambar ke PDF via /api/documents/{id}/convert-to-pdf."
-            ),
-        )
-    _ensure_storage_bucket(svc)
-    storage = svc.storage.from_(settings.supabase_bucket)
+
+def _run_extraction_in_background(d: dict[str, Any], document_id: str, user_id: str, run_id: str) -> None:
+    svc = get_supabase_service()
     try:
-        signed = storage.create_signed_url(d["storage_path"], 300)
-        url = signed.get("signedURL")
-        if not url:
-            raise Exception("signed url kosong")
+        svc.table("extraction_runs").update({"status": "running"}, returning=RETURN_MINIMAL).eq("id", run_id).execute()
+        _run_extraction(svc, d, document_id, user_id, run_id)
+    except HTTPException as e:
+        # Failures after the download are already recorded on the run; this covers the earlier ones.
+        _fail_pending_run(svc, run_id, str(e.detail))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Tidak bisa akses file di storage: {e}")
+        logger.exception("extract_background_failed: doc=%s", document_id)
+        _fail_pending_run(svc, run_id, str(e))
 
-    import httpx
 
+def _fail_pending_run(svc, run_id: str, notes: str) -> None:
     try:
-        r = httpx.get(url, timeout=60.0)
-        r.raise_for_status()
-        file_bytes = r.content
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Gagal download file untuk ekstraksi: {e}")
+        svc.table("extraction_runs").update({"status": "failed", "notes": notes}, returning=RETURN_MINIMAL).eq("id", run_id).in_(
+            "status", ["queued", "running"]
+        ).execute()
+    except Exception:
+        logger.warning("extract_run_fail_update_failed: run=%s", run_id, exc_info=True)
 
-    try:
-        kind = detect_upload_kind(file_bytes, filename=str(d.get("filename") or ""), content_type=str(d.get("mime_type") or "") or None)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    if kind != "pdf":
+
+def _require_pdf_document(d: dict[str, Any]) -> None:
+    inferred_kind = (str(d.get("file_kind") or "").strip().lower() or None)
+    if inferred_kind is None:
+        sp = str(d.get("storage_path") or "")
+        fn = str(d.get("filename") or "")
+        if "/images/" in sp.replace("\\", "/") or fn.lower().endswith((".png", ".jpg", ".jpeg")):
+            inferred_kind = "image"
+        else:
+            inferred_kind = "pdf"
+
+    if inferred_kind != "pdf":
         raise HTTPException(
             status_code=400,
             detail=(
-                "Konten file yang tersimpan bukan PDF. Ekstraksi hanya tersedia untuk PDF. "
+                "Dokumen ini berupa gambar. Ekstraksi hanya tersedia untuk PDF. "
                 "Langkah yang bisa dilakukan: (1) jalankan OCR MTO untuk gambar via /api/documents/{id}/mto, "
                 "atau (2) konversi gambar ke PDF via /api/documents/{id}/convert-to-pdf."
             ),
         )
 
-    svc.table("documents").update({"status": "extracting"}).eq("id", document_id).eq("owner_id", user_id).execute()
 
+@dataclass(slots=True)
+class _ParsedExtraction:
+    method: str
+    notes: str | None
+    extracted_json: dict[str, Any]
+    info: Any
+    mats: list[dict[str, Any]]
+    success: bool
+
+
+def _parse_pdf_for_extraction(file_bytes: bytes, document_id: str) -> _ParsedExtraction:
     method = "pdf_text"
     notes: str | None = None
-    text = ""
-    inserted = 0
-    extracted_json: dict[str, Any] = {}
-
-    try:
-        text = extract_pdf_text(file_bytes)
-        if len(text.strip()) < 200:
-            try:
-                ocr_text, ocr_note = ocr_pdf_text(file_bytes)
-            except Exception as e:
-                logger.exception("ocr_pdf_text_failed: doc=%s", document_id)
-                ocr_text, ocr_note = "", f"OCR error: {e}"
-
-            if ocr_text.strip():
-                text = ocr_text
-                method = "pdf_text_then_ocr"
-                notes = ocr_note
-            else:
-                method = "pdf_text_then_ocr"
-                notes = ocr_note or "OCR tidak menghasilkan teks"
-
-        extracted_json = build_extracted_json(text, method=method, notes=notes)
-        info = parse_doc_info(text)
-
-        mats: list[dict[str, Any]] = []
-        parse_warnings: list[str] = []
-        parser_used = "pdf_words_table"
+    # One parsed document serves the text pass, the OCR fallback and the table parser.
+    doc = open_pdf(file_bytes)
+    text = extract_pdf_text(file_bytes, doc=doc)
+    if len(text.strip()) < 200:
         try:
-            mats, parse_warnings = parse_materials_from_pdf_bytes(file_bytes, max_rows=5000)
+            ocr_text, ocr_note = ocr_pdf_text(file_bytes, doc=doc)
         except Exception as e:
-            logger.exception("parse_materials_from_pdf_bytes_failed: doc=%s", document_id)
-            parse_warnings = [f"parse_materials_from_pdf_bytes error: {e}"]
-            mats = []
+            logger.exception("ocr_pdf_text_failed: doc=%s", document_id)
+            ocr_text, ocr_note = "", f"OCR error: {e}"
+
+        if ocr_text.strip():
+            text = ocr_text
+            method = "pdf_text_then_ocr"
+            notes = ocr_note
+        else:
+            method = "pdf_text_then_ocr"
+            notes = ocr_note or "OCR tidak menghasilkan teks"
 
-        if not mats:
-            parser_used = "text_lines"
-            if len(text.strip()) >= 10:
-                mats = parse_materials(text, max_rows=5000)
-                parse_warnings = []
+    extracted_json = build_extracted_json(text, method=method, notes=notes)
+    info = parse_doc_info(text)
 
-        success = len(text.strip()) >= 10 or bool(mats)
+    mats: list[dict[str, Any]] = []
+    parse_warnings: list[str] = []
+    parser_used = "pdf_words_table"
+    try:
+        mats, parse_warnings = parse_materials_from_pdf_bytes(file_bytes, max_rows=5000, doc=doc)
+    except Exception as e:
+        logger.exception("parse_materials_from_pdf_bytes_failed: doc=%s", document_id)
+        parse_warnings = [f"parse_materials_from_pdf_bytes error: {e}"]
+        mats = []
 
-        if parse_warnings:
-            extra_notes = "\n".join(parse_warnings[:50])
-            notes = (notes + "\n" + extra_notes) if notes else extra_notes
+    if not mats:
+        parser_used = "text_lines"
+        if len(text.strip()) >= 10:
+            mats = parse_materials(text, max_rows=5000)
+            parse_warnings = []
 
-        extracted_json["materials_preview"] = mats[:20]
-        extracted_json["materials_parser"] = parser_used
-        if parse_warnings:
-            extracted_json["warnings"] = parse_warnings[:50]
+    success = len(text.strip()) >= 10 or bool(mats)
 
-        svc.table("documents").update(
-            {
-                "document_type": info.document_type,
-                "document_number": info.document_number,
-                "status": "success" if success else "failed",
-            }
-        ).eq("id", document_id).eq("owner_id", user_id).execute()
+    if parse_warnings:
+        extra_notes = "\n".join(parse_warnings[:50])
+        notes = (notes + "\n" + extra_notes) if notes else extra_notes
+
+    extracted_json["materials_preview"] = mats[:20]
+    extracted_json["materials_parser"] = parser_used
+    if parse_warnings:
+        extracted_json["warnings"] = parse_warnings[:50]
+    return _ParsedExtraction(method, notes, extracted_json, info, mats, success)
+
+
+def _run_extraction(
+    svc, d: dict[str, Any], document_id: str, user_id: str, run_id: str, *, marked: bool = False
+) -> dict[str, Any]:
+    # Flip the status while the PDF downloads (unless the caller already claimed the document);
+    # put the old status back if the file turns out unusable.
+    marking: Future | None = None
+    if not marked:
+        marking = _io_pool.submit(_set_document_status, svc, document_id, user_id, "extracting")
+    try:
+        file_bytes = _download_document_bytes(svc, d["storage_path"], "Gagal download file untuk ekstraksi")
+
+        try:
+            kind = detect_upload_kind(file_bytes, filename=str(d.get("filename") or ""), content_type=str(d.get("mime_type") or "") or None)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if kind != "pdf":
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    "Konten file yang tersimpan bukan PDF. Ekstraksi hanya tersedia untuk PDF. "
+                    "Langkah yang bisa dilakukan: (1) jalankan OCR MTO untuk gambar via /api/documents/{id}/mto, "
+                    "atau (2) konversi gambar ke PDF via /api/documents/{id}/convert-to-pdf."
+                ),
+            )
+    except HTTPException:
+        try:
+            if marking is not None:
+                marking.result()
+            _set_document_status(svc, document_id, user_id, str(d.get("status") or "uploaded"))
+        except Exception:
+            logger.warning("extract_status_restore_failed: doc=%s", document_id, exc_info=True)
+        raise
+    if marking is not None:
+        marking.result()
+
+    inserted = 0
+    parsed: _ParsedExtraction | None = None
+    doc_update: Future | None = None
+
+    try:
+        parsed = _cpu_bound(_parse_pdf_for_extraction, file_bytes, document_id)
+        info = parsed.info
+        mats = parsed.mats
+        success = parsed.success
+
+        doc_update = _io_pool.submit(
+            lambda: svc.table("documents")
+            .update(
+                {
+                    "document_type": info.document_type,
+                    "document_number": info.document_number,
+                    "status": "success" if success else "failed",
+                },
+                returning=RETURN_MINIMAL,
+            )
+            .eq("id", document_id)
+            .eq("owner_id", user_id)
+            .execute()
+        )
 
         if mats:
-            svc.table("materials").delete().eq("document_id", document_id).eq("owner_id", user_id).execute()
+            created_at = _utc_now_iso()
             to_insert: list[dict[str, Any]] = []
-            for m in mats:
+            for mat_id, m in zip(new_ids(len(mats)), mats):
                 to_insert.append(
                     {
-                        "id": str(uuid4()),
+                        "id": mat_id,
                         "owner_id": user_id,
                         "project_id": d["project_id"],
                         "document_id": document_id,
@@ -1111,109 +1668,286 @@ async def extract_document(document_id: str, user_id: str = Depends(_require_aut
                         "heat_no": None,
                         "tag_no": None,
                         "spec": m.get("spec"),
-                        "created_at": datetime.utcnow().isoformat(),
+                        "created_at": created_at,
                     }
                 )
-            ins = svc.table("materials").insert(to_insert).execute()
-            if ins is None:
-                raise HTTPException(status_code=500, detail="Gagal menyimpan material")
-            inserted = len(ins.data or [])
+            replaced = _replace_document_materials(svc, document_id, user_id, to_insert)
+            if replaced is None:
+                svc.table("materials").delete(returning=RETURN_MINIMAL).eq("document_id", document_id).eq(
+                    "owner_id", user_id
+                ).execute()
+                replaced = insert_rows_minimal(svc, "materials", to_insert)
+            inserted = replaced
 
-        run_id = str(uuid4())
         run_row = {
             "id": run_id,
             "owner_id": user_id,
             "document_id": document_id,
-            "method": method,
+            "method": parsed.method,
             "status": "success" if success else "failed",
-            "extracted_json": extracted_json,
-            "notes": notes,
-            "created_at": datetime.utcnow().isoformat(),
+            "extracted_json": parsed.extracted_json,
+            "notes": parsed.notes,
+            "created_at": _utc_now_iso(),
         }
-        svc.table("extraction_runs").insert(run_row).execute()
-
-        run_res = svc.table("extraction_runs").select("*").eq("id", run_id).eq("owner_id", user_id).limit(1).execute()
+        run_res = svc.table("extraction_runs").upsert(run_row).execute()
         if run_res is None:
             raise HTTPException(status_code=500, detail="Gagal mengambil hasil ekstraksi")
-        run = (run_res.data or [None])[0]
+        doc_update.result()
+        # The insert already returns the stored row; no need to read it back.
+        run = (run_res.data or [run_row])[0]
         return {"run": run, "inserted_materials": inserted}
     except HTTPException as e:
         logger.exception("extract_failed: doc=%s", document_id)
+        if doc_update is not None:
+            wait([doc_update])
         try:
-            svc.table("documents").update({"status": "failed"}).eq("id", document_id).eq("owner_id", user_id).execute()
-            svc.table("extraction_runs").insert(
+            _set_document_status(svc, document_id, user_id, "failed")
+            svc.table("extraction_runs").upsert(
                 {
-                    "id": str(uuid4()),
+                    "id": run_id,
                     "owner_id": user_id,
                     "document_id": document_id,
-                    "method": method,
+                    "method": parsed.method if parsed is not None else "pdf_text",
                     "status": "failed",
-                    "extracted_json": extracted_json or None,
+                    "extracted_json": parsed.extracted_json if parsed is not None else None,
                     "notes": str(e.detail),
-                    "created_at": datetime.utcnow().isoformat(),
-                }
+                    "created_at": _utc_now_iso(),
+                },
+                returning=RETURN_MINIMAL,
             ).execute()
         except Exception:
             pass
         raise
     except Exception as e:
         logger.exception("extract_failed: doc=%s", document_id)
+        if doc_update is not None:
+            wait([doc_update])
         try:
-            svc.table("documents").update({"status": "failed"}).eq("id", document_id).eq("owner_id", user_id).execute()
-            svc.table("extraction_runs").insert(
+            _set_document_status(svc, document_id, user_id, "failed")
+            svc.table("extraction_runs").upsert(
                 {
-                    "id": str(uuid4()),
+                    "id": run_id,
                     "owner_id": user_id,
                     "document_id": document_id,
-                    "method": method,
+                    "method": parsed.method if parsed is not None else "pdf_text",
                     "status": "failed",
-                    "extracted_json": extracted_json or None,
+                    "extracted_json": parsed.extracted_json if parsed is not None else None,
                     "notes": str(e),
-                    "created_at": datetime.utcnow().isoformat(),
-                }
+                    "created_at": _utc_now_iso(),
+                },
+                returning=RETURN_MINIMAL,
             ).execute()
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=f"Ekstraksi gagal: {e}")
 
 
+def _set_document_status(svc, document_id: str, user_id: str, status: str) -> None:
+    svc.table("documents").update({"status": status}, returning=RETURN_MINIMAL).eq("id", document_id).eq("owner_id", user_id).execute()
+
+
 def _parse_bbox(bbox: str | None) -> tuple[float, float, float, float] | None:
-    if not bbox:
+    try:
+        return parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# Re-running OCR on the same file with the same options is common (retries, CSV after preview,
+# import after extract); rows are remembered per content hash + options for an hour.
+_mto_rows_cache: TTLCache[str, list[dict[str, Any]]] = TTLCache(maxsize=256, ttl=3600.0)
+
+
+def _mto_cache_key(digest: str, page_index: int | None, bbox: Any, split_columns: bool | None) -> str:
+    return f"{digest}:{page_index}:{bbox}:{split_columns}"
+
+
+def _extract_mto_rows(
+    raw: bytes,
+    page_index: int | None,
+    *,
+    bbox: tuple[float, float, float, float] | None,
+    split_columns: bool | None,
+) -> list[dict[str, Any]]:
+    # page_index None means the bytes are an image.
+    key = _mto_cache_key(hashlib.blake2b(raw, digest_size=16).hexdigest(), page_index, bbox, split_columns)
+    cached = _mto_rows_cache.get(key)
+    if cached is None:
+        if page_index is None:
+            rows = _ocr_call(extract_mto_from_image_bytes_advanced, raw, bbox=bbox, split_columns=split_columns)
+        else:
+            rows = _ocr_call(extract_mto_from_pdf_bytes_advanced, raw, page_index, bbox=bbox, split_columns=split_columns)
+        cached = [dict(r) for r in rows]
+        _mto_rows_cache.set(key, cached)
+    # Callers may annotate the rows they get back; the cached copy stays untouched.
+    return [dict(r) for r in cached]
+
+
+MTO_MAX_PAGES = 50
+
+
+def _extract_mto_pages(
+    raw: bytes,
+    pages: list[int],
+    *,
+    bbox: tuple[float, float, float, float] | None,
+    split_columns: bool | None,
+) -> dict[int, list[dict[str, Any]]]:
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    found: dict[int, list[dict[str, Any]]] = {}
+    missing: list[int] = []
+    for p in pages:
+        cached = _mto_rows_cache.get(_mto_cache_key(digest, p, bbox, split_columns))
+        if cached is None:
+            missing.append(p)
+        else:
+            found[p] = cached
+    if len(missing) == 1 or (missing and OCR_PROCESSES <= 0):
+        for p in missing:
+            found[p] = _extract_mto_rows(raw, p, bbox=bbox, split_columns=split_columns)
+    elif missing:
+        # Workers read the PDF from disk once each instead of unpickling a copy per page.
+        with _spilled(raw, ".pdf") as path:
+            pool = _get_proc_pool()
+            futures = {
+                p: pool.submit(
+                    call_with_file_bytes, extract_mto_from_pdf_bytes_advanced, path, p, bbox=bbox, split_columns=split_columns
+                )
+                for p in missing
+            }
+            try:
+                for p, fut in futures.items():
+                    rows = [dict(r) for r in fut.result()]
+                    _mto_rows_cache.set(_mto_cache_key(digest, p, bbox, split_columns), rows)
+                    found[p] = rows
+            except BrokenProcessPool:
+                _shutdown_proc_pool()
+                raise
+            finally:
+                # The file goes away with this block; no page may still be waiting to read it.
+                wait(futures.values())
+    return {p: [dict(r) for r in found[p]] for p in pages}
+
+
+# Uploads never overwrite an object (every path carries the document id), so a copy on local
+# disk stays valid until the document is deleted and re-runs of extraction/OCR skip the transfer.
+# The copies are user documents: they live in a private (0700, owned by this process' user) folder
+# under the app's own cache dir, never in the shared temp dir, and carry their SHA-256 so a file
+# that was tampered with or cut short is treated as a miss.
+DOC_CACHE_DIR = Path(
+    os.getenv("PGN_DATALENS_DOC_CACHE_DIR")
+    or Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "pgn_datalens" / "docs"
+)
+DOC_CACHE_MAX_BYTES = int(os.getenv("PGN_DATALENS_DOC_CACHE_MAX_BYTES") or 512 * 1024 * 1024)
+_DOC_CACHE_DIGEST_SIZE = hashlib.sha256().digest_size
+_doc_cache_lock = threading.Lock()
+
+
+def _doc_cache_dir() -> Path | None:
+    """Return DOC_CACHE_DIR if it is a private folder of this user (created 0700 when missing), else None."""
+    try:
+        DOC_CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = os.lstat(DOC_CACHE_DIR)
+    except OSError:
+        logger.debug("doc_cache_dir_unavailable", exc_info=True)
+        return None
+    if not stat.S_ISDIR(st.st_mode):
+        logger.warning("doc_cache_dir_rejected: %s bukan folder", DOC_CACHE_DIR)
+        return None
+    if hasattr(os, "getuid") and (st.st_uid != os.getuid() or st.st_mode & 0o022):
+        logger.warning("doc_cache_dir_rejected: %s bukan milik user ini atau bisa ditulis user lain", DOC_CACHE_DIR)
         return None
-    parts = [p.strip() for p in bbox.split(",")]
-    if len(parts) != 4:
-        raise HTTPException(status_code=400, detail="bbox harus format: x0,y0,x1,y1")
+    return DOC_CACHE_DIR
+
+
+def _doc_cache_path(storage_path: str) -> Path:
+    return DOC_CACHE_DIR / hashlib.blake2b(storage_path.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _read_cached_document(storage_path: str) -> bytes | None:
+    if _doc_cache_dir() is None:
+        return None
+    path = _doc_cache_path(storage_path)
     try:
-        x0, y0, x1, y1 = (float(parts[0]), float(parts[1]), float(parts[2]), float(parts[3]))
-    except Exception:
-        raise HTTPException(status_code=400, detail="bbox harus angka: x0,y0,x1,y1")
-    return (x0, y0, x1, y1)
+        blob = path.read_bytes()
+        os.utime(path)
+    except OSError:
+        return None
+    digest, data = blob[:_DOC_CACHE_DIGEST_SIZE], blob[_DOC_CACHE_DIGEST_SIZE:]
+    if len(digest) != _DOC_CACHE_DIGEST_SIZE or hashlib.sha256(data).digest() != digest:
+        _drop_cached_document(storage_path)
+        return None
+    return data
 
 
-async def _download_document_bytes(svc, storage_path: str) -> bytes:
-    _ensure_storage_bucket(svc)
-    storage = svc.storage.from_(settings.supabase_bucket)
+def _store_cached_document(storage_path: str, data: bytes) -> None:
+    if len(data) > DOC_CACHE_MAX_BYTES:
+        return
+    cache_dir = _doc_cache_dir()
+    if cache_dir is None:
+        return
+    path = _doc_cache_path(storage_path)
     try:
-        signed = storage.create_signed_url(storage_path, 300)
-        url = signed.get("signedURL")
-        if not url:
-            raise Exception("signed url kosong")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Tidak bisa akses file di storage: {e}")
+        tmp = path.with_name(f"{path.name}.{new_id()}.tmp")
+        fd = os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0), 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(hashlib.sha256(data).digest())
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        logger.debug("doc_cache_store_failed", exc_info=True)
+        return
+    with _doc_cache_lock:
+        entries = []
+        total = 0
+        try:
+            scan = list(os.scandir(cache_dir))
+        except OSError:
+            return
+        for entry in scan:
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue  # evicted by another process meanwhile
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        if total > DOC_CACHE_MAX_BYTES:
+            for _, size, old in sorted(entries):
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+                total -= size
+                if total <= DOC_CACHE_MAX_BYTES:
+                    break
+
+
+def _drop_cached_document(storage_path: str) -> None:
+    try:
+        os.remove(_doc_cache_path(storage_path))
+    except OSError:
+        pass
 
-    import httpx
 
+def _download_document_bytes(svc, storage_path: str, failure: str = "Gagal download file") -> bytes:
+    cached = _read_cached_document(storage_path)
+    if cached is not None:
+        return cached
+    _ensure_storage_bucket(svc)
+    storage = svc.storage.from_(settings.supabase_bucket)
+    # Service-role download straight from the storage API over the cached client's keep-alive session;
+    # no signed URL + second HTTPS hop.
     try:
-        r = httpx.get(url, timeout=60.0)
-        r.raise_for_status()
-        return r.content
-    except httpx.HTTPStatusError as e:
-        status = getattr(getattr(e, "response", None), "status_code", None)
-        if status == 404:
-            raise HTTPException(status_code=404, detail="File tidak ditemukan di storage (404)")
-        raise HTTPException(status_code=400, detail=f"Gagal download file: HTTP {status}")
+        data = storage.download(storage_path)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Gagal download file: {e}")
+        msg = str(e).lower()
+        if "not_found" in msg or "object not found" in msg:
+            raise HTTPException(status_code=404, detail="File tidak ditemukan di storage (404)")
+        raise HTTPException(status_code=400, detail=f"{failure}: {e}")
+    _store_cached_document(storage_path, data)
+    return data
 
 
 def _upload_output_bytes(
@@ -1233,15 +1967,25 @@ def _upload_output_bytes(
         storage.upload(storage_path, content, cast(Any, _storage_file_options(content_type)))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Upload output gagal: {e}")
+    # download_url is filled in by the caller, which signs all its outputs in one request.
+    return {"storage_path": storage_path, "download_url": None, "content_type": content_type, "bytes": len(content)}
 
-    download_url = None
-    try:
-        signed = storage.create_signed_url(storage_path, settings.signed_url_expires_seconds)
-        download_url = signed.get("signedURL")
-    except Exception:
-        download_url = None
 
-    return {"storage_path": storage_path, "download_url": download_url, "content_type": content_type, "bytes": len(content)}
+def _claim_document(svc, document_id: str, user_id: str, status: str) -> dict[str, Any] | None:
+    # Ownership check + status flip in one round-trip; returns the row as it was before.
+    # None means the RPC (migration 0013) is unavailable and the caller should fall back.
+    try:
+        res = svc.rpc("claim_document", {"p_document": document_id, "p_owner": user_id, "p_status": status}).execute()
+    except Exception as e:
+        if getattr(e, "code", None) not in _MISSING_FUNCTION_CODES:
+            raise
+        logger.debug("claim_document_rpc_unavailable", exc_info=True)
+        return None
+    if not isinstance(res.data, list):
+        return None
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Dokumen tidak ditemukan")
+    return res.data[0]
 
 
 def _require_doc_owner(svc, document_id: str, user_id: str) -> dict[str, Any]:
@@ -1253,17 +1997,18 @@ def _require_doc_owner(svc, document_id: str, user_id: str) -> dict[str, Any]:
     return doc.data[0]
 
 
+_BOOL_PARAMS = {
+    **dict.fromkeys(("1", "true", "yes", "y", "on"), True),
+    **dict.fromkeys(("0", "false", "no", "n", "off"), False),
+}
+
+
 def _parse_bool_param(v: Any) -> bool | None:
     if v is None:
         return None
     if isinstance(v, bool):
         return v
-    s = str(v).strip().lower()
-    if s in ("1", "true", "yes", "y", "on"):
-        return True
-    if s in ("0", "false", "no", "n", "off"):
-        return False
-    return None
+    return _BOOL_PARAMS.get(str(v).strip().lower())
 
 
 async def _get_params_query_or_form(request: Request) -> dict[str, str]:
@@ -1289,6 +2034,103 @@ async def extract_mto_from_document(
     user_id: str = Depends(_require_auth),
 ):
     params = await _get_params_query_or_form(request)
+    return await run_in_threadpool(_extract_mto_from_document, document_id, params, user_id)
+
+
+MTO_TXT_HEADER = "\t".join(MTO_COLUMNS)
+MTO_CSV_HEADER = (",".join(MTO_COLUMNS) + "\r\n").encode("utf-8")
+
+
+_mto_row_values = itemgetter(*MTO_COLUMNS)
+
+
+def _mto_cells(rows: list[dict[str, Any]]) -> list[tuple[Any, ...]]:
+    # OCR rows always carry every column, so one C-level itemgetter call per row does;
+    # the per-key .get() path only covers hand-built rows.
+    cells: list[tuple[Any, ...]] = []
+    for r in rows:
+        try:
+            cells.append(_mto_row_values(r))
+        except KeyError:
+            cells.append(tuple(r.get(k) for k in MTO_COLUMNS))
+    return cells
+
+
+def _mto_txt_bytes(rows: list[dict[str, Any]], cells: list[tuple[Any, ...]] | None = None) -> bytes:
+    lines = [MTO_TXT_HEADER]
+    lines.extend("\t".join([str(v) if v else "" for v in row]) for row in (cells if cells is not None else _mto_cells(rows)))
+    lines.append("")
+    return "\n".join(lines).encode("utf-8")
+
+
+def _mto_csv_bytes(rows: list[dict[str, Any]], cells: list[tuple[Any, ...]] | None = None) -> bytes:
+    # The CSV is encoded straight into one bytes buffer instead of a str buffer plus a copy;
+    # writerows over plain tuples keeps the per-row work inside the C csv writer.
+    buf = io.BytesIO()
+    buf.write(MTO_CSV_HEADER)
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="", write_through=True)
+    w = csv.writer(text)
+    w.writerows(cells if cells is not None else _mto_cells(rows))
+    text.detach()
+    return buf.getvalue()
+
+
+MTO_CSV_STREAM_ROWS = 256
+
+
+async def _mto_csv_stream(rows: list[dict[str, Any]]):
+    # Async so Starlette iterates it on the loop; each slice is small enough not to stall it,
+    # and the client gets the header and first rows without waiting for the whole table.
+    yield MTO_CSV_HEADER
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="", write_through=True)
+    w = csv.writer(text)
+    for start in range(0, len(rows), MTO_CSV_STREAM_ROWS):
+        w.writerows(_mto_cells(rows[start : start + MTO_CSV_STREAM_ROWS]))
+        chunk = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        yield chunk
+
+
+def _write_mto_outputs(
+    svc, d: dict[str, Any], document_id: str, user_id: str, page_index: int, rows: list[dict[str, Any]]
+) -> dict[str, Any]:
+    proj_id = str(d.get("project_id") or "")
+    # Both outputs format the same cells; pull them out of the row dicts once.
+    cells = _mto_cells(rows)
+    _ensure_storage_bucket(svc)
+    # The two uploads overlap; both files are then signed in one batch request.
+    txt_job = _io_pool.submit(
+        _upload_output_bytes,
+        svc,
+        user_id=user_id,
+        project_id=proj_id,
+        document_id=document_id,
+        filename=f"mto_page{int(page_index)}.txt",
+        content=_mto_txt_bytes(rows, cells),
+        content_type="text/plain; charset=utf-8",
+    )
+    try:
+        out_csv = _upload_output_bytes(
+            svc,
+            user_id=user_id,
+            project_id=proj_id,
+            document_id=document_id,
+            filename=f"mto_page{int(page_index)}.csv",
+            content=_mto_csv_bytes(rows, cells),
+            content_type="text/csv; charset=utf-8",
+        )
+    finally:
+        wait([txt_job])
+    out_txt = txt_job.result()
+    urls = _signed_urls(svc.storage.from_(settings.supabase_bucket), [out_txt["storage_path"], out_csv["storage_path"]])
+    out_txt["download_url"] = urls.get(out_txt["storage_path"])
+    out_csv["download_url"] = urls.get(out_csv["storage_path"])
+    return {"txt": out_txt, "csv": out_csv}
+
+
+def _extract_mto_from_document(document_id: str, params: dict[str, str], user_id: str) -> dict[str, Any]:
     try:
         page_index = int(params.get("page_index") or 0)
     except Exception:
@@ -1302,7 +2144,7 @@ async def extract_mto_from_document(
     if not storage_path:
         raise HTTPException(status_code=400, detail="storage_path kosong")
 
-    raw = await _download_document_bytes(svc, storage_path)
+    raw = _download_document_bytes(svc, storage_path)
 
     logger.info("mto_extract: doc=%s kind=%s page_index=%s", document_id, file_kind, page_index)
 
@@ -1311,132 +2153,123 @@ async def extract_mto_from_document(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    if file_kind == "image" or kind == "image":
-        try:
-            rows = extract_mto_from_image_bytes_advanced(raw, bbox=_parse_bbox(bbox), split_columns=split_columns)
-        except Exception as e:
-            msg = str(e)
-            if "Tesseract OCR tidak terdeteksi" in msg or "pytesseract tidak tersedia" in msg:
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        "OCR belum tersedia di server. Install Tesseract OCR di Windows dan pastikan tesseract.exe ada di PATH, "
-                        "atau set env TESSERACT_CMD. Setelah itu ulangi OCR MTO. Jika perlu, gunakan opsi konversi gambar ke PDF."
-                    ),
-                )
-            logger.exception("mto_extract_failed: doc=%s", document_id)
-            raise HTTPException(status_code=400, detail=f"OCR MTO gagal: {e}")
-
-        proj_id = str(d.get("project_id") or "")
-        txt_lines = ["item\tmaterial\tdescription\tnps\tqty_value\tqty_unit\tsource"]
-        for r in rows:
-            txt_lines.append(
-                "\t".join(
-                    [
-                        str(r.get("item") or ""),
-                        str(r.get("material") or ""),
-                        str(r.get("description") or ""),
-                        str(r.get("nps") or ""),
-                        str(r.get("qty_value") or ""),
-                        str(r.get("qty_unit") or ""),
-                        str(r.get("source") or ""),
-                    ]
-                )
+    is_image = file_kind == "image" or kind == "image"
+    try:
+        rows = _extract_mto_rows(
+            raw, None if is_image else page_index, bbox=_parse_bbox(bbox), split_columns=split_columns
+        )
+    except Exception as e:
+        msg = str(e)
+        if is_image and ("Tesseract OCR tidak terdeteksi" in msg or "pytesseract tidak tersedia" in msg):
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    "OCR belum tersedia di server. Install Tesseract OCR di Windows dan pastikan tesseract.exe ada di PATH, "
+                    "atau set env TESSERACT_CMD. Setelah itu ulangi OCR MTO. Jika perlu, gunakan opsi konversi gambar ke PDF."
+                ),
             )
-        txt_bytes = ("\n".join(txt_lines) + "\n").encode("utf-8")
+        logger.exception("mto_extract_failed: doc=%s", document_id)
+        raise HTTPException(status_code=400, detail=f"OCR MTO gagal: {e}")
 
-        csv_buf = io.StringIO()
-        w = csv.DictWriter(
-            csv_buf,
-            fieldnames=["item", "material", "description", "nps", "qty_value", "qty_unit", "source"],
-            extrasaction="ignore",
-        )
-        w.writeheader()
-        for r in rows:
-            w.writerow(r)
-        csv_bytes = csv_buf.getvalue().encode("utf-8")
+    return {"items": rows, "outputs": _write_mto_outputs(svc, d, document_id, user_id, page_index, rows)}
 
-        out_txt = _upload_output_bytes(
-            svc,
-            user_id=user_id,
-            project_id=proj_id,
-            document_id=document_id,
-            filename=f"mto_page{int(page_index)}.txt",
-            content=txt_bytes,
-            content_type="text/plain; charset=utf-8",
-        )
-        out_csv = _upload_output_bytes(
-            svc,
-            user_id=user_id,
-            project_id=proj_id,
-            document_id=document_id,
-            filename=f"mto_page{int(page_index)}.csv",
-            content=csv_bytes,
-            content_type="text/csv; charset=utf-8",
-        )
 
-        return {"items": rows, "outputs": {"txt": out_txt, "csv": out_csv}}
+def _parse_page_indices(raw: str | None) -> list[int]:
+    try:
+        pages = [int(x) for x in (raw or "").replace(" ", "").split(",") if x]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="page_indices harus berupa daftar integer: 0,1,2")
+    if not pages or any(p < 0 for p in pages):
+        raise HTTPException(status_code=400, detail="page_indices harus berupa daftar integer: 0,1,2")
+    pages = list(dict.fromkeys(pages))
+    if len(pages) > MTO_MAX_PAGES:
+        raise HTTPException(status_code=400, detail=f"Maksimal {MTO_MAX_PAGES} halaman per permintaan")
+    return pages
+
+
+def _extract_mto_pages_from_document(document_id: str, params: dict[str, str], user_id: str) -> dict[str, Any]:
+    pages = _parse_page_indices(params.get("page_indices"))
+    bbox = _parse_bbox(cast(str | None, params.get("bbox")))
+    split_columns = _parse_bool_param(params.get("split_columns"))
+    svc = get_supabase_service()
+    d = _require_doc_owner(svc, document_id, user_id)
+    storage_path = str(d.get("storage_path") or "")
+    if not storage_path:
+        raise HTTPException(status_code=400, detail="storage_path kosong")
 
+    raw = _download_document_bytes(svc, storage_path)
     try:
-        rows = extract_mto_from_pdf_bytes_advanced(raw, int(page_index), bbox=_parse_bbox(bbox), split_columns=split_columns)
+        kind = detect_upload_kind(raw, filename=str(d.get("filename") or ""), content_type=str(d.get("mime_type") or "") or None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if kind != "pdf" or (str(d.get("file_kind") or "").strip().lower() or "pdf") == "image":
+        raise HTTPException(status_code=400, detail="OCR multi-halaman hanya untuk dokumen PDF")
+
+    logger.info("mto_extract_pages: doc=%s pages=%s", document_id, pages)
+    try:
+        by_page = _extract_mto_pages(raw, pages, bbox=bbox, split_columns=split_columns)
     except Exception as e:
         logger.exception("mto_extract_failed: doc=%s", document_id)
         raise HTTPException(status_code=400, detail=f"OCR MTO gagal: {e}")
-    
-    proj_id = str(d.get("project_id") or "")
-    txt_lines = ["item\tmaterial\tdescription\tnps\tqty_value\tqty_unit\tsource"]
-    for r in rows:
-        txt_lines.append(
-            "\t".join(
-                [
-                    str(r.get("item") or ""),
-                    str(r.get("material") or ""),
-                    str(r.get("description") or ""),
-                    str(r.get("nps") or ""),
-                    str(r.get("qty_value") or ""),
-                    str(r.get("qty_unit") or ""),
-                    str(r.get("source") or ""),
-                ]
-            )
-        )
-    txt_bytes = ("\n".join(txt_lines) + "\n").encode("utf-8")
-
-    csv_buf = io.StringIO()
-    w = csv.DictWriter(
-        csv_buf,
-        fieldnames=["item", "material", "description", "nps", "qty_value", "qty_unit", "source"],
-        extrasaction="ignore",
-    )
-    w.writeheader()
-    for r in rows:
-        w.writerow(r)
-    csv_bytes = csv_buf.getvalue().encode("utf-8")
+    return {"pages": [{"page_index": p, "items": by_page[p]} for p in pages]}
 
-    out_txt = _upload_output_bytes(
-        svc,
-        user_id=user_id,
-        project_id=proj_id,
-        document_id=document_id,
-        filename=f"mto_page{int(page_index)}.txt",
-        content=txt_bytes,
-        content_type="text/plain; charset=utf-8",
-    )
-    out_csv = _upload_output_bytes(
-        svc,
-        user_id=user_id,
-        project_id=proj_id,
-        document_id=document_id,
-        filename=f"mto_page{int(page_index)}.csv",
-        content=csv_bytes,
-        content_type="text/csv; charset=utf-8",
-    )
 
-    return {"items": rows, "outputs": {"txt": out_txt, "csv": out_csv}}
+@app.post("/api/documents/{document_id}/mto/all")
+async def extract_mto_pages_from_document(
+    document_id: str,
+    request: Request,
+    user_id: str = Depends(_require_auth),
+):
+    params = await _get_params_query_or_form(request)
+    return await run_in_threadpool(_extract_mto_pages_from_document, document_id, params, user_id)
 
 
 @app.post("/api/documents/{document_id}/mto/import")
 async def import_mto_ocr(document_id: str, request: Request, user_id: str = Depends(_require_auth)):
     params = await _get_params_query_or_form(request)
+    return await run_in_threadpool(_import_mto_ocr, document_id, params, user_id)
+
+
+# A repeated import (double-click, client retry) of the same file with the same options
+# returns the run it just made instead of running OCR and swapping the materials again.
+MTO_IMPORT_REUSE_SECONDS = 120
+
+
+def _recent_mto_import(
+    svc, d: dict[str, Any], user_id: str, run_params: dict[str, Any], content_sha256: str
+) -> dict[str, Any] | None:
+    run_id = d.get("last_ocr_run_id")
+    if not run_id:
+        return None
+    try:
+        res = svc.table("ocr_runs").select("*").eq("id", run_id).eq("owner_id", user_id).limit(1).execute()
+        run = (res.data or [None])[0]
+        if not run or run.get("params") != run_params or run.get("content_sha256") != content_sha256:
+            return None
+        processed_at = datetime.fromisoformat(str(run.get("processed_at")).replace("Z", "+00:00"))
+    except Exception:
+        logger.debug("mto_import_reuse_lookup_failed", exc_info=True)
+        return None
+    if (datetime.now(timezone.utc) - processed_at).total_seconds() > MTO_IMPORT_REUSE_SECONDS:
+        return None
+    exts = (
+        svc.table("ocr_item_extractions")
+        .select("raw_payload,flags")
+        .eq("ocr_run_id", run_id)
+        .eq("owner_id", user_id)
+        .order("line_no", desc=False)
+        .execute()
+    ).data or []
+    return {
+        "ocr_run": run,
+        "items": [e["raw_payload"] for e in exts if e.get("raw_payload")],
+        "inserted_materials": len(exts),
+        "flagged": sum(1 for e in exts if (e.get("flags") or {}).get("needs_review")),
+        "reused": True,
+    }
+
+
+def _import_mto_ocr(document_id: str, params: dict[str, str], user_id: str) -> dict[str, Any]:
     try:
         page_index = int(params.get("page_index") or 0)
     except Exception:
@@ -1449,7 +2282,7 @@ async def import_mto_ocr(document_id: str, request: Request, user_id: str = Depe
     storage_path = str(d.get("storage_path") or "")
     if not storage_path:
         raise HTTPException(status_code=400, detail="storage_path kosong")
-    raw = await _download_document_bytes(svc, storage_path)
+    raw = _download_document_bytes(svc, storage_path)
 
     file_kind = (str(d.get("file_kind") or "").strip().lower() or "pdf")
     try:
@@ -1457,11 +2290,22 @@ async def import_mto_ocr(document_id: str, request: Request, user_id: str = Depe
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+    bbox_value = _parse_bbox(bbox)
+    run_params = {
+        "page_index": page_index,
+        "bbox": list(bbox_value) if bbox_value else None,
+        "split_columns": split_columns,
+    }
+    content_sha256 = hashlib.sha256(raw).hexdigest()
+    recent = _recent_mto_import(svc, d, user_id, run_params, content_sha256)
+    if recent is not None:
+        return recent
+
     try:
         if file_kind == "image" or kind == "image":
-            rows = extract_mto_from_image_bytes_advanced(raw, bbox=_parse_bbox(bbox), split_columns=split_columns)
+            rows = _extract_mto_rows(raw, None, bbox=bbox_value, split_columns=split_columns)
         else:
-            rows = extract_mto_from_pdf_bytes_advanced(raw, int(page_index), bbox=_parse_bbox(bbox), split_columns=split_columns)
+            rows = _extract_mto_rows(raw, int(page_index), bbox=bbox_value, split_columns=split_columns)
     except Exception as e:
         msg = str(e)
         if "Tesseract OCR tidak terdeteksi" in msg or "pytesseract tidak tersedia" in msg:
@@ -1475,7 +2319,7 @@ async def import_mto_ocr(document_id: str, request: Request, user_id: str = Depe
         logger.exception("mto_import_failed: doc=%s", document_id)
         raise HTTPException(status_code=400, detail=f"OCR MTO gagal: {e}")
 
-    run_id = str(uuid4())
+    run_id = new_id()
     now = _utc_now_iso()
     engine_version = _tesseract_engine_version()
     run_row = {
@@ -1490,69 +2334,91 @@ async def import_mto_ocr(document_id: str, request: Request, user_id: str = Depe
         "input_filename": d.get("filename"),
         "input_storage_path": d.get("storage_path"),
         "created_at": now,
+        "params": run_params,
+        "content_sha256": content_sha256,
     }
-    svc.table("ocr_runs").insert(run_row).execute()
-    svc.table("documents").update({"last_ocr_run_id": run_id, "last_ocr_processed_at": now}).eq("id", document_id).eq("owner_id", user_id).execute()
-
     try:
-        svc.table("materials").delete().eq("document_id", document_id).eq("owner_id", user_id).eq("data_source", "ocr").execute()
-    except Exception:
-        pass
+        svc.table("ocr_runs").insert(run_row, returning=RETURN_MINIMAL).execute()
+    except Exception as e:
+        if getattr(e, "code", None) not in _MISSING_COLUMN_CODES:
+            raise
+        # Before migration 0015 the table has no params/content_sha256 columns.
+        logger.debug("ocr_run_params_unavailable", exc_info=True)
+        del run_row["params"], run_row["content_sha256"]
+        svc.table("ocr_runs").insert(run_row, returning=RETURN_MINIMAL).execute()
+    svc.table("documents").update(
+        {"last_ocr_run_id": run_id, "last_ocr_processed_at": now}, returning=RETURN_MINIMAL
+    ).eq("id", document_id).eq("owner_id", user_id).execute()
 
     extractions: list[dict[str, Any]] = []
     mats_to_insert: list[dict[str, Any]] = []
     flagged = 0
-    for r in rows:
+    project_id = d.get("project_id")
+    page_no = int(page_index)
+    # Per-run columns are filled once; each row copies the base and sets only its own fields.
+    extraction_base = {
+        "owner_id": user_id,
+        "project_id": project_id,
+        "document_id": document_id,
+        "ocr_run_id": run_id,
+        "page_index": page_no,
+        "confidence": None,
+        "created_at": now,
+    }
+    material_base = {
+        "owner_id": user_id,
+        "project_id": project_id,
+        "document_id": document_id,
+        "heat_no": None,
+        "tag_no": None,
+        "created_at": now,
+        "data_source": "ocr",
+        "ocr_run_id": run_id,
+    }
+    ids = new_ids(2 * len(rows))
+    for i, r in enumerate(rows):
         norm, flags = _mto_row_to_material_fields(r)
-        needs_review = len(flags) > 0
+        needs_review = bool(flags)
         if needs_review:
             flagged += 1
-        extraction_id = str(uuid4())
-        extractions.append(
-            {
-                "id": extraction_id,
-                "owner_id": user_id,
-                "project_id": d.get("project_id"),
-                "document_id": document_id,
-                "ocr_run_id": run_id,
-                "page_index": int(page_index),
-                "line_no": int(r.get("item") or 0) if str(r.get("item") or "").isdigit() else None,
-                "raw_payload": r,
-                "normalized_fields": norm,
-                "confidence": None,
-                "flags": {"flags": flags, "needs_review": needs_review},
-                "created_at": now,
-            }
-        )
-
-        mats_to_insert.append(
-            {
-                "id": str(uuid4()),
-                "owner_id": user_id,
-                "project_id": d.get("project_id"),
-                "document_id": document_id,
-                "description": norm.get("description") or "",
-                "spec": norm.get("spec"),
-                "size": norm.get("size"),
-                "quantity": norm.get("quantity"),
-                "unit": norm.get("unit"),
-                "heat_no": None,
-                "tag_no": None,
-                "created_at": now,
-                "data_source": "ocr",
-                "verification_status": "needs_review" if needs_review else "draft",
-                "needs_review": needs_review,
-                "ocr_run_id": run_id,
-                "ocr_extraction_id": extraction_id,
-            }
-        )
-
-    if extractions:
-        svc.table("ocr_item_extractions").insert(extractions).execute()
-    inserted = 0
-    if mats_to_insert:
-        ins = svc.table("materials").insert(mats_to_insert).execute()
-        inserted = len(ins.data or [])
+        item = str(r.get("item") or "")
+        extraction_id = ids[2 * i]
+        ext = extraction_base.copy()
+        ext["id"] = extraction_id
+        ext["line_no"] = int(item) if item.isdigit() else None
+        ext["raw_payload"] = r
+        ext["normalized_fields"] = norm
+        ext["flags"] = {"flags": flags, "needs_review": needs_review}
+        extractions.append(ext)
+
+        mat = material_base.copy()
+        mat["id"] = ids[2 * i + 1]
+        mat["description"] = norm["description"]
+        mat["spec"] = norm["spec"]
+        mat["size"] = norm["size"]
+        mat["quantity"] = norm["quantity"]
+        mat["unit"] = norm["unit"]
+        mat["verification_status"] = "needs_review" if needs_review else "draft"
+        mat["needs_review"] = needs_review
+        mat["ocr_extraction_id"] = extraction_id
+        mats_to_insert.append(mat)
+
+    # No foreign key links the two tables, so the material swap runs alongside the extraction slices.
+    extraction_jobs = submit_insert_chunks(svc, "ocr_item_extractions", extractions, "Gagal menyimpan hasil OCR")
+    replacing = _io_pool.submit(_replace_document_materials, svc, document_id, user_id, mats_to_insert, "ocr")
+    wait([*extraction_jobs, replacing])
+    for job in extraction_jobs:
+        job.result()
+    replaced = replacing.result()
+    if replaced is None:
+        try:
+            svc.table("materials").delete(returning=RETURN_MINIMAL).eq("document_id", document_id).eq(
+                "owner_id", user_id
+            ).eq("data_source", "ocr").execute()
+        except Exception:
+            pass
+        replaced = insert_rows_minimal(svc, "materials", mats_to_insert)
+    inserted = replaced
 
     return {
         "ocr_run": run_row,
@@ -1604,23 +2470,39 @@ async def extract_mto_from_document_csv(document_id: str, request: Request, user
     payload = await extract_mto_from_document(document_id, request, user_id=user_id)
     rows = (payload or {}).get("items") or []
 
-    buf = io.StringIO()
-    writer = csv.DictWriter(
-        buf,
-        fieldnames=["item", "material", "description", "nps", "qty_value", "qty_unit", "source"],
-        extrasaction="ignore",
-    )
-    writer.writeheader()
-    for r in rows:
-        writer.writerow(r)
-
-    out = buf.getvalue().encode("utf-8")
     headers = {"Content-Disposition": "attachment; filename=materials_take_off.csv"}
-    return StreamingResponse(iter([out]), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(_mto_csv_stream(rows), media_type="text/csv; charset=utf-8", headers=headers)
+
+
+def _discard_storage_object(storage, path: str) -> None:
+    try:
+        storage.remove([path])
+    except Exception:
+        logger.warning("storage_remove_failed: path=%s", path, exc_info=True)
+
+
+def _converted_document(svc, user_id: str, project_id: str, source_sha256: str) -> dict[str, Any] | None:
+    try:
+        res = (
+            svc.table("documents")
+            .select("*")
+            .eq("owner_id", user_id)
+            .eq("project_id", project_id)
+            .eq("source_sha256", source_sha256)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        if getattr(e, "code", None) not in _MISSING_COLUMN_CODES:
+            raise
+        # Before migration 0017 the table has no source_sha256 column.
+        logger.debug("converted_document_lookup_unavailable", exc_info=True)
+        return None
+    return (res.data or [None])[0]
 
 
 @app.post("/api/documents/{document_id}/convert-to-pdf", response_model=Document)
-async def convert_document_image_to_pdf(document_id: str, user_id: str = Depends(_require_auth)):
+def convert_document_image_to_pdf(document_id: str, user_id: str = Depends(_require_auth)):
     svc = get_supabase_service()
     d = _require_doc_owner(svc, document_id, user_id)
     file_kind = (str(d.get("file_kind") or "").strip().lower() or "pdf")
@@ -1631,20 +2513,31 @@ async def convert_document_image_to_pdf(document_id: str, user_id: str = Depends
     if file_kind != "image":
         raise HTTPException(status_code=400, detail="Dokumen ini bukan gambar")
 
-    raw = await _download_document_bytes(svc, storage_path)
+    raw = _download_document_bytes(svc, storage_path)
+    project_id = str(d.get("project_id"))
+    # Keyed on the source image: the generated PDF carries a creation timestamp, so its own
+    # bytes differ on every conversion.
+    source_sha256 = hashlib.sha256(raw).hexdigest()
+    existing = _converted_document(svc, user_id, project_id, source_sha256)
+    if existing is not None:
+        logger.info("convert_to_pdf: doc=%s reused=%s", document_id, existing.get("id"))
+        _ensure_storage_bucket(svc)
+        storage = svc.storage.from_(settings.supabase_bucket)
+        existing["download_url"] = _signed_urls(storage, [existing["storage_path"]])[existing["storage_path"]]
+        return _validated_json(_DOCUMENT, existing)
+
     logger.info("convert_to_pdf: doc=%s", document_id)
     try:
-        pdf_bytes = convert_image_bytes_to_pdf(raw)
+        pdf_bytes = _cpu_bound(convert_image_bytes_to_pdf, raw)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Konversi gambar ke PDF gagal: {e}")
 
-    new_id = str(uuid4())
-    project_id = str(d.get("project_id"))
-    filename = f"{new_id}.pdf"
-    new_storage_path = f"{user_id}/{project_id}/{new_id}/{filename}"
-    now = datetime.utcnow().isoformat()
+    pdf_id = new_id()
+    filename = f"{pdf_id}.pdf"
+    new_storage_path = f"{user_id}/{project_id}/{pdf_id}/{filename}"
+    now = _utc_now_iso()
     row = {
-        "id": new_id,
+        "id": pdf_id,
         "project_id": project_id,
         "owner_id": user_id,
         "storage_path": new_storage_path,
@@ -1660,6 +2553,7 @@ async def convert_document_image_to_pdf(document_id: str, user_id: str = Depends
         "image_width": None,
         "image_height": None,
         "original_filename": d.get("original_filename") or d.get("filename"),
+        "source_sha256": source_sha256,
     }
 
     _ensure_storage_bucket(svc)
@@ -1669,17 +2563,55 @@ async def convert_document_image_to_pdf(document_id: str, user_id: str = Depends
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Upload PDF hasil konversi gagal: {e}")
 
-    ins = svc.table("documents").insert(row).execute()
+    signing = _io_pool.submit(_sign_new_object, storage, new_storage_path)
+    try:
+        ins = svc.table("documents").insert(row).execute()
+    except Exception as e:
+        code = getattr(e, "code", None)
+        if code == _PG_UNIQUE_VIOLATION:
+            # A concurrent conversion of the same image won the unique index: answer with its row.
+            _discard_storage_object(storage, new_storage_path)
+            existing = _converted_document(svc, user_id, project_id, source_sha256)
+            if existing is None:
+                raise
+            existing["download_url"] = _signed_urls(storage, [existing["storage_path"]])[existing["storage_path"]]
+            return _validated_json(_DOCUMENT, existing)
+        if code not in _MISSING_COLUMN_CODES:
+            raise
+        # Before migration 0017 the table has no source_sha256 column.
+        logger.debug("converted_document_hash_unavailable", exc_info=True)
+        del row["source_sha256"]
+        ins = svc.table("documents").insert(row).execute()
     if ins is None or not ins.data:
         raise HTTPException(status_code=500, detail="Simpan metadata dokumen gagal")
 
+    row["download_url"] = signing.result()
+    return _validated_json(_DOCUMENT, row)
+
+
+def _mto_rows_from_upload(
+    file: Any, page_index: int, bbox: tuple[float, float, float, float] | None, split_columns: bool | None
+) -> list[dict[str, Any]]:
+    # Read the spooled upload on the worker thread that runs the OCR: no extra event-loop hop,
+    # and the bytes are dropped as soon as the rows are out instead of living until the response.
     try:
-        signed = storage.create_signed_url(new_storage_path, settings.signed_url_expires_seconds)
-        row["download_url"] = signed.get("signedURL")
+        file.seek(0)
+        raw = file.read()
     except Exception:
-        row["download_url"] = None
+        raise HTTPException(status_code=400, detail="Gagal membaca file")
+    return _extract_mto_rows(raw, page_index, bbox=bbox, split_columns=split_columns)
 
-    return Document(**row)
+
+async def _mto_rows_for_upload(
+    pdf: UploadFile, page_index: int, bbox: str | None, split_columns: bool | None
+) -> list[dict[str, Any]]:
+    bbox_value = _parse_bbox(bbox)
+    try:
+        return await run_in_threadpool(_mto_rows_from_upload, pdf.file, int(page_index), bbox_value, split_columns)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/mto")
@@ -1689,65 +2621,119 @@ async def extract_mto(
     bbox: str | None = Form(None),
     split_columns: bool | None = Form(None),
 ):
-    try:
-        pdf_bytes = await pdf.read()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Gagal membaca file")
+    rows = await _mto_rows_for_upload(pdf, page_index, bbox, split_columns)
+    return {"items": rows}
 
-    try:
-        rows = extract_mto_from_pdf_bytes_advanced(
-            pdf_bytes,
-            int(page_index),
-            bbox=_parse_bbox(bbox),
-            split_columns=split_columns,
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
 
-    return {"items": rows}
+# Queued /api/mto jobs live in this process only, so polling must reach the worker that took the job.
+# They run on their own pool, never the request-path I/O pool, and at most MTO_JOB_QUEUE are
+# accepted (running or waiting) at a time. A job is never dropped while it is pending; once it has
+# finished its result is kept MTO_JOB_RESULT_SECONDS from completion, and beyond MTO_JOB_MAX_RESULTS
+# finished jobs the oldest results go first.
+MTO_JOB_QUEUE = int(os.getenv("PGN_DATALENS_MTO_JOB_QUEUE") or 2 * CPU_WORKERS)
+MTO_JOB_RESULT_SECONDS = 900.0
+MTO_JOB_MAX_RESULTS = 256
+_mto_job_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="pgn_mto_job")
+_mto_job_slots = threading.BoundedSemaphore(MTO_JOB_QUEUE)
 
 
-@app.post("/api/mto/csv")
-async def extract_mto_csv(
+@dataclass(slots=True)
+class _MtoJob:
+    user_id: str
+    future: Future[list[dict[str, Any]]]
+    finished_at: float | None = None
+
+
+_mto_jobs: dict[str, _MtoJob] = {}
+_mto_jobs_lock = threading.Lock()
+
+
+def _sweep_mto_jobs(now: float) -> None:
+    # Caller holds _mto_jobs_lock. Pending jobs (finished_at None) are never candidates.
+    finished = sorted((j.finished_at, job_id) for job_id, j in _mto_jobs.items() if j.finished_at is not None)
+    excess = len(finished) - MTO_JOB_MAX_RESULTS
+    for i, (finished_at, job_id) in enumerate(finished):
+        if i >= excess and finished_at + MTO_JOB_RESULT_SECONDS > now:
+            break
+        del _mto_jobs[job_id]
+
+
+def _mark_mto_job_finished(job: _MtoJob) -> None:
+    with _mto_jobs_lock:
+        job.finished_at = time.monotonic()
+
+
+def _run_mto_job(
+    raw: bytes, page_index: int, bbox: tuple[float, float, float, float] | None, split_columns: bool | None
+) -> list[dict[str, Any]]:
+    # The slot is freed before the future resolves, so a client that saw "done" can queue again.
+    try:
+        return _extract_mto_rows(raw, page_index, bbox=bbox, split_columns=split_columns)
+    finally:
+        _mto_job_slots.release()
+
+
+@app.post("/api/mto/async", status_code=202)
+async def extract_mto_async(
     pdf: UploadFile = File(...),
     page_index: int = Form(5),
     bbox: str | None = Form(None),
     split_columns: bool | None = Form(None),
+    user_id: str = Depends(_require_auth),
 ):
-    try:
-        pdf_bytes = await pdf.read()
-    except Exception:
-        raise HTTPException(status_code=400, detail="Gagal membaca file")
-
-    try:
-        rows = extract_mto_from_pdf_bytes_advanced(
-            pdf_bytes,
-            int(page_index),
-            bbox=_parse_bbox(bbox),
-            split_columns=split_columns,
+    bbox_value = _parse_bbox(bbox)
+    _require_upload_size(_upload_size(pdf))
+    if not _mto_job_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503, detail="Antrean OCR MTO penuh, coba lagi nanti", headers={"Retry-After": "30"}
         )
-    except HTTPException:
+    try:
+        # The upload is closed once the response is sent, so the bytes are taken before queueing.
+        raw = await pdf.read()
+        if not raw:
+            raise HTTPException(status_code=400, detail="File kosong")
+        job = _mto_job_pool.submit(_run_mto_job, raw, int(page_index), bbox_value, split_columns)
+    except BaseException:
+        _mto_job_slots.release()
         raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    job_id = new_id()
+    entry = _MtoJob(user_id, job)
+    with _mto_jobs_lock:
+        _sweep_mto_jobs(time.monotonic())
+        _mto_jobs[job_id] = entry
+    job.add_done_callback(lambda _: _mark_mto_job_finished(entry))
+    return {"job_id": job_id, "status": "running"}
+
+
+@app.get("/api/mto/jobs/{job_id}")
+def get_mto_job(job_id: str, user_id: str = Depends(_require_auth)):
+    with _mto_jobs_lock:
+        _sweep_mto_jobs(time.monotonic())
+        entry = _mto_jobs.get(job_id)
+    if entry is None or entry.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job MTO tidak ditemukan")
+    job = entry.future
+    if not job.done():
+        return {"job_id": job_id, "status": "running"}
+    err = job.exception()
+    if err is not None:
+        detail = err.detail if isinstance(err, HTTPException) else str(err)
+        return {"job_id": job_id, "status": "failed", "detail": detail}
+    return {"job_id": job_id, "status": "done", "items": job.result()}
 
-    buf = io.StringIO()
-    writer = csv.DictWriter(
-        buf,
-        fieldnames=["item", "material", "description", "nps", "qty_value", "qty_unit", "source"],
-        extrasaction="ignore",
-    )
-    writer.writeheader()
-    for r in rows:
-        writer.writerow(r)
 
-    out = buf.getvalue().encode("utf-8")
+@app.post("/api/mto/csv")
+async def extract_mto_csv(
+    pdf: UploadFile = File(...),
+    page_index: int = Form(5),
+    bbox: str | None = Form(None),
+    split_columns: bool | None = Form(None),
+):
+    rows = await _mto_rows_for_upload(pdf, page_index, bbox, split_columns)
     headers = {"Content-Disposition": "attachment; filename=materials_take_off.csv"}
-    return StreamingResponse(iter([out]), media_type="text/csv; charset=utf-8", headers=headers)
+    return StreamingResponse(_mto_csv_stream(rows), media_type="text/csv; charset=utf-8", headers=headers)
 
 
 @app.exception_handler(HTTPException)
 def http_exception_handler(_: Request, exc: HTTPException):
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    return _ResponseClass(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
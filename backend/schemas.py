@@ -9,7 +9,7 @@ from pydantic import BaseModel
 DocumentStatus = Literal["uploaded", "extracting", "success", "failed"]
 DocumentType = Literal["MRR", "MIR", "PipeBook", "BeritaAcara", "Sertifikat", "Lainnya"]
 ExtractionMethod = Literal["pdf_text", "ocr", "pdf_text_then_ocr"]
-ExtractionStatus = Literal["success", "failed"]
+ExtractionStatus = Literal["queued", "running", "success", "failed"]
 
 
 class AuthRequest(BaseModel):
@@ -144,6 +144,7 @@ class MaterialListResponse(BaseModel):
     offset: int
     limit: int
     next_offset: int | None = None
+    total: int | None = None
 
 
 class ExtractionRun(BaseModel):
@@ -1 +1,2 @@
-
+# The documents columns the maintenance scripts read; fetching only these keeps lookups lean.
+DOCUMENT_COLUMNS = "id,owner_id,project_id,storage_path,filename,status,file_kind,mime_type"
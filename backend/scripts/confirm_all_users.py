@@ -1,30 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from backend.db import get_supabase_service
 
+# Without the admin_confirm_all_users RPC (migration 0016) GoTrue has no bulk confirm;
+# a few updates in flight at once hide most of the round-trips.
+CONFIRM_WORKERS = 8
+
 
 def main() -> None:
     svc = get_supabase_service()
+    try:
+        res = svc.rpc("admin_confirm_all_users").execute()
+    except Exception as e:
+        print({"rpc_unavailable": str(e)})
+    else:
+        print({"confirmed": res.data})
+        return
+
     page = 1
     per_page = 200
     updated = 0
     scanned = 0
 
-    while True:
-        users = svc.auth.admin.list_users(page=page, per_page=per_page)
-        if not users:
-            break
-        for u in users:
-            scanned += 1
-            uid = getattr(u, "id", None)
-            email_confirmed_at = getattr(u, "email_confirmed_at", None)
-            if not uid:
-                continue
-            if email_confirmed_at:
-                continue
-            svc.auth.admin.update_user_by_id(str(uid), {"email_confirm": True})
-            updated += 1
-        if len(users) < per_page:
-            break
-        page += 1
+    with ThreadPoolExecutor(max_workers=CONFIRM_WORKERS) as pool:
+        while True:
+            users = svc.auth.admin.list_users(page=page, per_page=per_page)
+            if not users:
+                break
+            pending = []
+            for u in users:
+                scanned += 1
+                uid = getattr(u, "id", None)
+                email_confirmed_at = getattr(u, "email_confirmed_at", None)
+                if not uid:
+                    continue
+                if email_confirmed_at:
+                    continue
+                pending.append(pool.submit(svc.auth.admin.update_user_by_id, str(uid), {"email_confirm": True}))
+            # Finish the page before asking for the next, so paging never races the updates.
+            for job in pending:
+                job.result()
+            updated += len(pending)
+            if len(users) < per_page:
+                break
+            page += 1
 
     print({"scanned": scanned, "confirmed": updated})
 
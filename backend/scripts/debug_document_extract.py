@@ -7,10 +7,9 @@ ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-import httpx
-from supabase import create_client
-
 from backend.app_settings import settings
+from backend.db import get_supabase_service
+from backend.scripts import DOCUMENT_COLUMNS
 from backend.services.extraction import (
     detect_upload_kind,
     extract_pdf_text,
@@ -31,8 +30,8 @@ def main() -> int:
     if not settings.supabase_url or not settings.supabase_service_role_key:
         raise RuntimeError("Missing SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY")
 
-    svc = create_client(settings.supabase_url, settings.supabase_service_role_key)
-    res = svc.table("documents").select("*").or_(f"id.eq.{doc_id},filename.eq.{doc_id}.pdf,filename.ilike.%{doc_id}%").execute()
+    svc = get_supabase_service()
+    res = svc.table("documents").select(DOCUMENT_COLUMNS).or_(f"id.eq.{doc_id},filename.eq.{doc_id}.pdf,filename.ilike.%{doc_id}%").execute()
     docs = res.data or []
     print("matched_docs=", len(docs))
     if not docs:
@@ -46,15 +45,8 @@ def main() -> int:
     print("doc.mime_type=", d.get("mime_type"))
 
     storage = svc.storage.from_(settings.supabase_bucket)
-    signed = storage.create_signed_url(d["storage_path"], 300)
-    url = signed.get("signedURL")
-    if not url:
-        raise RuntimeError("signedURL kosong")
-
-    r = httpx.get(url, timeout=60.0)
-    print("download.status=", r.status_code)
-    r.raise_for_status()
-    b = r.content
+    # Service-role download over the shared pooled client; no signed URL + second connection.
+    b = storage.download(d["storage_path"])
     print("download.bytes=", len(b))
     print("head=", b[:10])
 
@@ -1,18 +1,17 @@
 from __future__ import annotations
 
 import sys
+from concurrent.futures import wait
 from pathlib import Path
-from uuid import uuid4
-
-import httpx
-from supabase import create_client
 
 ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from backend.app_settings import settings
-from backend.main import _mto_row_to_material_fields, _tesseract_engine_version, _utc_now_iso
+from backend.db import RETURN_MINIMAL, get_supabase_service, new_id, new_ids, submit_insert_chunks
+from backend.scripts import DOCUMENT_COLUMNS
+from backend.main import _io_pool, _mto_row_to_material_fields, _tesseract_engine_version, _utc_now_iso
 from backend.services.extraction import (
     detect_upload_kind,
     extract_mto_from_image_bytes_advanced,
@@ -26,22 +25,18 @@ def main() -> int:
         return 2
 
     document_id = sys.argv[1].strip().removesuffix(".pdf").removesuffix(".png")
-    svc = create_client(settings.supabase_url, settings.supabase_service_role_key)
-    doc_res = svc.table("documents").select("*").eq("id", document_id).limit(1).execute()
+    # `tesseract --version` runs while the document is fetched and OCR'd; the result is cached.
+    engine_version = _io_pool.submit(_tesseract_engine_version)
+    svc = get_supabase_service()
+    doc_res = svc.table("documents").select(DOCUMENT_COLUMNS).eq("id", document_id).limit(1).execute()
     doc = (doc_res.data or [None])[0]
     if not doc:
         print("not found")
         return 1
 
     storage = svc.storage.from_(settings.supabase_bucket)
-    signed = storage.create_signed_url(doc["storage_path"], 300)
-    url = signed.get("signedURL")
-    if not url:
-        raise RuntimeError("signedURL kosong")
-
-    r = httpx.get(url, timeout=60.0)
-    r.raise_for_status()
-    raw = r.content
+    # Service-role download over the shared pooled client; no signed URL + second connection.
+    raw = storage.download(doc["storage_path"])
 
     kind = detect_upload_kind(raw, filename=str(doc.get("filename") or ""), content_type=str(doc.get("mime_type") or "") or None)
     page_index = 0
@@ -50,7 +45,7 @@ def main() -> int:
     else:
         rows = extract_mto_from_pdf_bytes_advanced(raw, page_index)
 
-    run_id = str(uuid4())
+    run_id = new_id()
     now = _utc_now_iso()
     run_row = {
         "id": run_id,
@@ -58,65 +53,76 @@ def main() -> int:
         "project_id": doc["project_id"],
         "document_id": doc["id"],
         "engine_name": "tesseract",
-        "engine_version": _tesseract_engine_version(),
+        "engine_version": engine_version.result(),
         "processed_at": now,
         "input_file_kind": doc.get("file_kind"),
         "input_filename": doc.get("filename"),
         "input_storage_path": doc.get("storage_path"),
         "created_at": now,
     }
-    svc.table("ocr_runs").insert(run_row).execute()
-    svc.table("documents").update({"last_ocr_run_id": run_id, "last_ocr_processed_at": now}).eq("id", doc["id"]).execute()
-    svc.table("materials").delete().eq("document_id", doc["id"]).eq("owner_id", doc["owner_id"]).eq("data_source", "ocr").execute()
+    svc.table("ocr_runs").insert(run_row, returning=RETURN_MINIMAL).execute()
+    svc.table("documents").update(
+        {"last_ocr_run_id": run_id, "last_ocr_processed_at": now}, returning=RETURN_MINIMAL
+    ).eq("id", doc["id"]).execute()
+    svc.table("materials").delete(returning=RETURN_MINIMAL).eq("document_id", doc["id"]).eq(
+        "owner_id", doc["owner_id"]
+    ).eq("data_source", "ocr").execute()
 
     extractions = []
     mats = []
     flagged = 0
-    for r in rows:
+    extraction_base = {
+        "owner_id": doc["owner_id"],
+        "project_id": doc["project_id"],
+        "document_id": doc["id"],
+        "ocr_run_id": run_id,
+        "page_index": page_index,
+        "confidence": None,
+        "created_at": now,
+    }
+    material_base = {
+        "owner_id": doc["owner_id"],
+        "project_id": doc["project_id"],
+        "document_id": doc["id"],
+        "created_at": now,
+        "data_source": "ocr",
+        "ocr_run_id": run_id,
+    }
+    ids = new_ids(2 * len(rows))
+    for i, r in enumerate(rows):
         norm, flags = _mto_row_to_material_fields(r)
         needs_review = len(flags) > 0
         if needs_review:
             flagged += 1
-        ext_id = str(uuid4())
-        extractions.append(
-            {
-                "id": ext_id,
-                "owner_id": doc["owner_id"],
-                "project_id": doc["project_id"],
-                "document_id": doc["id"],
-                "ocr_run_id": run_id,
-                "page_index": page_index,
-                "line_no": int(r.get("item") or 0) if str(r.get("item") or "").isdigit() else None,
-                "raw_payload": r,
-                "normalized_fields": norm,
-                "confidence": None,
-                "flags": {"flags": flags, "needs_review": needs_review},
-                "created_at": now,
-            }
-        )
-        mats.append(
-            {
-                "id": str(uuid4()),
-                "owner_id": doc["owner_id"],
-                "project_id": doc["project_id"],
-                "document_id": doc["id"],
-                "description": norm.get("description") or "",
-                "spec": norm.get("spec"),
-                "size": norm.get("size"),
-                "quantity": norm.get("quantity"),
-                "unit": norm.get("unit"),
-                "created_at": now,
-                "data_source": "ocr",
-                "verification_status": "needs_review" if needs_review else "draft",
-                "needs_review": needs_review,
-                "ocr_run_id": run_id,
-                "ocr_extraction_id": ext_id,
-            }
-        )
+        ext_id = ids[2 * i]
+        ext = extraction_base.copy()
+        ext["id"] = ext_id
+        ext["line_no"] = int(r.get("item") or 0) if str(r.get("item") or "").isdigit() else None
+        ext["raw_payload"] = r
+        ext["normalized_fields"] = norm
+        ext["flags"] = {"flags": flags, "needs_review": needs_review}
+        extractions.append(ext)
+
+        mat = material_base.copy()
+        mat["id"] = ids[2 * i + 1]
+        mat["description"] = norm.get("description") or ""
+        mat["spec"] = norm.get("spec")
+        mat["size"] = norm.get("size")
+        mat["quantity"] = norm.get("quantity")
+        mat["unit"] = norm.get("unit")
+        mat["verification_status"] = "needs_review" if needs_review else "draft"
+        mat["needs_review"] = needs_review
+        mat["ocr_extraction_id"] = ext_id
+        mats.append(mat)
 
-    svc.table("ocr_item_extractions").insert(extractions).execute()
-    ins = svc.table("materials").insert(mats).execute()
-    print({"run_id": run_id, "rows": len(rows), "inserted": len(ins.data or []), "flagged": flagged})
+    # 500-row slices of both tables go out together, without echoing the rows back.
+    extraction_jobs = submit_insert_chunks(svc, "ocr_item_extractions", extractions, "Gagal menyimpan hasil OCR")
+    material_jobs = submit_insert_chunks(svc, "materials", mats)
+    wait(extraction_jobs + material_jobs)
+    for job in extraction_jobs:
+        job.result()
+    inserted = sum(job.result() for job in material_jobs)
+    print({"run_id": run_id, "rows": len(rows), "inserted": inserted, "flagged": flagged})
     return 0
 
 
@@ -5,16 +5,7 @@ import csv
 import json
 from pathlib import Path
 
-from backend.services.extraction import extract_mto_from_pdf_bytes_advanced
-
-
-def _parse_bbox(s: str | None):
-    if not s:
-        return None
-    parts = [p.strip() for p in s.split(",")]
-    if len(parts) != 4:
-        raise ValueError("bbox harus format x0,y0,x1,y1")
-    return (float(parts[0]), float(parts[1]), float(parts[2]), float(parts[3]))
+from backend.services.extraction import MTO_COLUMNS, extract_mto_from_pdf_bytes_advanced, parse_bbox
 
 
 def main() -> int:
@@ -31,21 +22,16 @@ def main() -> int:
     rows = extract_mto_from_pdf_bytes_advanced(
         pdf_bytes,
         int(args.page_index),
-        bbox=_parse_bbox(args.bbox),
+        bbox=parse_bbox(args.bbox),
         split_columns=True if args.split_columns else None,
     )
 
     if args.csv:
         out_path = Path(args.csv)
         with out_path.open("w", encoding="utf-8", newline="") as f:
-            w = csv.DictWriter(
-                f,
-                fieldnames=["item", "material", "description", "nps", "qty_value", "qty_unit", "source"],
-                extrasaction="ignore",
-            )
-            w.writeheader()
-            for r in rows:
-                w.writerow(r)
+            w = csv.writer(f)
+            w.writerow(MTO_COLUMNS)
+            w.writerows(tuple(r.get(k) for k in MTO_COLUMNS) for r in rows)
         return 0
 
     print(json.dumps({"items": rows}, ensure_ascii=False))
@@ -1,21 +1,22 @@
 from __future__ import annotations
 
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
 
 ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-import httpx
-from supabase import create_client
-
 from backend.app_settings import settings
+from backend.db import RETURN_MINIMAL, get_supabase_service, insert_rows_minimal, new_id, new_ids
+from backend.scripts import DOCUMENT_COLUMNS
 from backend.services.extraction import (
     build_extracted_json,
     detect_upload_kind,
     extract_pdf_text,
     ocr_pdf_text,
+    open_pdf,
     parse_doc_info,
     parse_materials,
     parse_materials_from_pdf_bytes,
@@ -31,8 +32,8 @@ def main() -> int:
     if not settings.supabase_url or not settings.supabase_service_role_key:
         raise RuntimeError("Missing SUPABASE_URL / SUPABASE_SERVICE_ROLE_KEY")
 
-    svc = create_client(settings.supabase_url, settings.supabase_service_role_key)
-    doc_res = svc.table("documents").select("*").eq("id", document_id).limit(1).execute()
+    svc = get_supabase_service()
+    doc_res = svc.table("documents").select(DOCUMENT_COLUMNS).eq("id", document_id).limit(1).execute()
     d = (doc_res.data or [None])[0]
     if not d:
         print("not found")
@@ -43,28 +44,23 @@ def main() -> int:
     storage_path = d["storage_path"]
 
     storage = svc.storage.from_(settings.supabase_bucket)
-    signed = storage.create_signed_url(storage_path, 300)
-    url = signed.get("signedURL")
-    if not url:
-        raise RuntimeError("signedURL kosong")
-
-    r = httpx.get(url, timeout=60.0)
-    r.raise_for_status()
-    file_bytes = r.content
+    # Service-role download over the shared pooled client; no signed URL + second connection.
+    file_bytes = storage.download(storage_path)
 
     kind = detect_upload_kind(file_bytes, filename=str(d.get("filename") or ""), content_type=str(d.get("mime_type") or "") or None)
     if kind != "pdf":
         print("not a pdf")
         return 1
 
-    svc.table("documents").update({"status": "extracting"}).eq("id", document_id).execute()
+    svc.table("documents").update({"status": "extracting"}, returning=RETURN_MINIMAL).eq("id", document_id).execute()
 
-    text = extract_pdf_text(file_bytes)
+    pdf = open_pdf(file_bytes)
+    text = extract_pdf_text(file_bytes, doc=pdf)
     method = "pdf_text"
     notes: str | None = None
 
     if len(text.strip()) < 200:
-        ocr_text, ocr_note = ocr_pdf_text(file_bytes)
+        ocr_text, ocr_note = ocr_pdf_text(file_bytes, doc=pdf)
         if ocr_text.strip():
             text = ocr_text
             method = "pdf_text_then_ocr"
@@ -76,7 +72,7 @@ def main() -> int:
     extracted_json = build_extracted_json(text, method=method, notes=notes)
     info = parse_doc_info(text)
 
-    mats, parse_warnings = parse_materials_from_pdf_bytes(file_bytes, max_rows=5000)
+    mats, parse_warnings = parse_materials_from_pdf_bytes(file_bytes, max_rows=5000, doc=pdf)
     parser_used = "pdf_words_table" if mats else "text_lines"
     if not mats and len(text.strip()) >= 10:
         mats = parse_materials(text, max_rows=5000)
@@ -98,20 +94,19 @@ def main() -> int:
             "document_type": info.document_type,
             "document_number": info.document_number,
             "status": "success" if success else "failed",
-        }
+        },
+        returning=RETURN_MINIMAL,
     ).eq("id", document_id).execute()
 
+    now = datetime.now(timezone.utc).isoformat()
     inserted = 0
     if mats:
-        svc.table("materials").delete().eq("document_id", document_id).eq("owner_id", user_id).execute()
+        svc.table("materials").delete(returning=RETURN_MINIMAL).eq("document_id", document_id).eq("owner_id", user_id).execute()
         to_insert = []
-        from uuid import uuid4
-        from datetime import datetime
-
-        for m in mats:
+        for mat_id, m in zip(new_ids(len(mats)), mats):
             to_insert.append(
                 {
-                    "id": str(uuid4()),
+                    "id": mat_id,
                     "owner_id": user_id,
                     "project_id": project_id,
                     "document_id": document_id,
@@ -122,16 +117,12 @@ def main() -> int:
                     "heat_no": None,
                     "tag_no": None,
                     "spec": m.get("spec"),
-                    "created_at": datetime.utcnow().isoformat(),
+                    "created_at": now,
                 }
             )
-        ins = svc.table("materials").insert(to_insert).execute()
-        inserted = len(ins.data or [])
-
-    from uuid import uuid4
-    from datetime import datetime
+        inserted = insert_rows_minimal(svc, "materials", to_insert)
 
-    run_id = str(uuid4())
+    run_id = new_id()
     svc.table("extraction_runs").insert(
         {
             "id": run_id,
@@ -141,8 +132,9 @@ def main() -> int:
             "status": "success" if success else "failed",
             "extracted_json": extracted_json,
             "notes": notes,
-            "created_at": datetime.utcnow().isoformat(),
-        }
+            "created_at": now,
+        },
+        returning=RETURN_MINIMAL,
     ).execute()
 
     print("done", {"success": success, "inserted": inserted, "method": method})
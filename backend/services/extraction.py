@@ -6,7 +6,8 @@ import re
 import logging
 import shutil
 from dataclasses import dataclass
-from typing import Any, Protocol, cast
+from functools import lru_cache
+from typing import Any, Callable, Protocol, TypeVar, cast
 import importlib
 
 try:
@@ -35,7 +36,8 @@ logger = logging.getLogger("pgn_datalens.extraction")
 def _is_pdf_bytes(data: bytes) -> bool:
     if not data:
         return False
-    head = data.lstrip()[:8]
+    # Only the prefix matters; stripping the whole buffer would copy a multi-MB file.
+    head = data[:1024].lstrip()[:8]
     return head.startswith(b"%PDF-")
 
 
@@ -61,22 +63,25 @@ def detect_upload_kind(
     ct = (content_type or "").strip().lower() or None
 
     pdf_sig = _is_pdf_bytes(file_bytes)
-    img_fmt, _, _ = _detect_image_format(file_bytes)
-    img_ok = img_fmt in {"PNG", "JPEG", "WEBP"}
 
     if ext in _ALLOWED_PDF_EXTS:
         if pdf_sig:
             return "pdf"
         raise ValueError("File berekstensi .pdf tetapi kontennya bukan PDF")
 
+    if ext == "" and pdf_sig:
+        return "pdf"
+
+    # Decoding the image is the expensive part; PDFs settled above never get here.
+    img_fmt, _, _ = _detect_image_format(file_bytes)
+    img_ok = img_fmt in {"PNG", "JPEG", "WEBP"}
+
     if ext in _ALLOWED_IMAGE_EXTS:
         if img_ok:
             return "image"
         raise ValueError("File berekstensi gambar tetapi kontennya bukan JPEG/PNG/WEBP")
 
     if ext == "":
-        if pdf_sig:
-            return "pdf"
         if img_ok:
             return "image"
         if ct in _ALLOWED_PDF_MIMES:
@@ -317,12 +322,15 @@ def _parse_table_row_line(line: str) -> dict[str, Any] | None:
     return {"description": desc[:500], "quantity": qty, "unit": unit, "size": size}
 
 
-def parse_materials_from_pdf_bytes(file_bytes: bytes, max_rows: int = 5000) -> tuple[list[dict[str, Any]], list[str]]:
+def parse_materials_from_pdf_bytes(
+    file_bytes: bytes, max_rows: int = 5000, *, doc: Any = None
+) -> tuple[list[dict[str, Any]], list[str]]:
     rows: list[dict[str, Any]] = []
     warnings: list[str] = []
 
     _require_fitz()
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    if doc is None:
+        doc = fitz.open(stream=file_bytes, filetype="pdf")
     for page_index in range(len(doc)):
         if len(rows) >= max_rows:
             break
@@ -550,10 +558,17 @@ def _parse_right_anchored_row_line(line: str) -> dict[str, Any] | None:
     return {"description": item_raw[:500], "quantity": qty, "unit": unit, "size": size}
 
 
-def extract_pdf_text(file_bytes: bytes) -> str:
+def open_pdf(file_bytes: bytes) -> Any:
+    if fitz is None:
+        return None
+    return fitz.open(stream=file_bytes, filetype="pdf")
+
+
+def extract_pdf_text(file_bytes: bytes, *, doc: Any = None) -> str:
     if fitz is None:
         return ""
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    if doc is None:
+        doc = fitz.open(stream=file_bytes, filetype="pdf")
     parts: list[str] = []
     for page in doc:
         t = cast(_MuPDFPage, page).get_text("text") or ""
@@ -562,6 +577,7 @@ def extract_pdf_text(file_bytes: bytes) -> str:
     return "\n".join(parts)
 
 
+@lru_cache(maxsize=1)
 def _try_import_pytesseract():
     try:
         pytesseract = importlib.import_module("pytesseract")
@@ -825,7 +841,14 @@ def extract_mto_from_image_bytes_advanced(
     return [merged[k] for k in sorted(merged.keys())]
 
 
-def ocr_pdf_text(file_bytes: bytes, max_pages: int = 15) -> tuple[str, str | None]:
+def _pixmap_to_image(pix: Any) -> Image.Image:
+    # Plain RGB pixmaps map straight onto a PIL image; anything else still goes through PNG.
+    if pix.n == 3 and not pix.alpha:
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    return Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
+
+
+def ocr_pdf_text(file_bytes: bytes, max_pages: int = 15, *, doc: Any = None) -> tuple[str, str | None]:
     pytesseract = _try_import_pytesseract()
     if pytesseract is None:
         return "", "pytesseract tidak tersedia"
@@ -833,14 +856,14 @@ def ocr_pdf_text(file_bytes: bytes, max_pages: int = 15) -> tuple[str, str | Non
     if fitz is None:
         return "", "PyMuPDF (fitz) tidak tersedia"
 
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    if doc is None:
+        doc = fitz.open(stream=file_bytes, filetype="pdf")
     out: list[str] = []
     pages = min(len(doc), max_pages)
 
     for i in range(pages):
         page = cast(_MuPDFPage, doc[i])
-        pix = page.get_pixmap(dpi=200)
-        img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
+        img = _pixmap_to_image(page.get_pixmap(dpi=200))
         try:
             txt = pytesseract.image_to_string(img)
         except Exception as e:
@@ -887,9 +910,7 @@ def _render_pdf_page_to_image(pdf_bytes: bytes, page_index: int, dpi: int) -> Im
 
     page = cast(_MuPDFPage, doc[page_index])
     zoom = max(1.0, float(dpi) / 72.0)
-    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
-    img = Image.open(io.BytesIO(pix.tobytes("png"))).convert("RGB")
-    return img
+    return _pixmap_to_image(page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False))
 
 
 def _preprocess_for_ocr(img: Image.Image, *, threshold: int = 185, upscale: float = 2.0) -> Image.Image:
@@ -1089,6 +1110,24 @@ def _parse_qty(text: str) -> tuple[float | None, str | None]:
     return num, unit
 
 
+def parse_bbox(s: str | None) -> tuple[float, float, float, float] | None:
+    if not s:
+        return None
+    parts = s.split(",")
+    if len(parts) != 4:
+        raise ValueError("bbox harus format: x0,y0,x1,y1")
+    try:
+        # float() already ignores surrounding whitespace.
+        x0, y0, x1, y1 = map(float, parts)
+    except ValueError:
+        raise ValueError("bbox harus angka: x0,y0,x1,y1") from None
+    return (x0, y0, x1, y1)
+
+
+# Keys of every MTO row produced below, in output (TXT/CSV) column order.
+MTO_COLUMNS = ("item", "material", "description", "nps", "qty_value", "qty_unit", "source")
+
+
 def _tokens_to_rows(tokens: list[_OCRToken], img_w: int, img_h: int, *, source: str) -> list[dict[str, Any]]:
     clean = [t for t in tokens if t.conf >= 30 and t.text.strip()]
     if not clean:
@@ -1272,6 +1311,27 @@ def extract_mto_from_pdf_bytes_advanced(
     return [merged[k] for k in sorted(merged.keys())]
 
 
+_T = TypeVar("_T")
+
+
+def call_with_file_bytes(fn: Callable[..., _T], path: str, *args: Any, **kwargs: Any) -> _T:
+    # Entry point for worker processes: they get a file path instead of a pickled copy of the file.
+    with open(path, "rb") as f:
+        data = f.read()
+    return fn(data, *args, **kwargs)
+
+
+def warm_ocr_worker() -> None:
+    # Process-pool initializer: locate Tesseract once per worker instead of on its first job.
+    pytesseract = _try_import_pytesseract()
+    if pytesseract is None:
+        return
+    try:
+        _ensure_tesseract_ready(pytesseract)
+    except Exception:
+        pass
+
+
 def detect_document_type(text: str) -> str:
     t = text.lower()
     if "pipe book" in t or "pipebook" in t:
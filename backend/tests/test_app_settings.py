@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+class EnvFileTests(unittest.TestCase):
+    def setUp(self):
+        from backend import app_settings
+
+        self.app_settings = app_settings
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name: str, text: str) -> str:
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_parses_comments_export_and_quotes(self):
+        path = self._write(
+            ".env",
+            "# comment\n"
+            "\n"
+            "SUPABASE_URL=https://example.supabase.co\n"
+            "export SUPABASE_BUCKET = 'docs'\n"
+            'SUPABASE_ANON_KEY="anon=with=equals"\n'
+            "NOT_A_PAIR\n",
+        )
+        self.assertEqual(
+            self.app_settings._read_env_file(path),
+            {
+                "supabase_url": "https://example.supabase.co",
+                "supabase_bucket": "docs",
+                "supabase_anon_key": "anon=with=equals",
+            },
+        )
+
+    def test_strips_inline_comments_outside_quotes(self):
+        path = self._write(
+            ".env",
+            "SUPABASE_URL=https://example.supabase.co  # prod\n"
+            "export SUPABASE_BUCKET='docs' # bucket\n"
+            'SUPABASE_ANON_KEY="anon # not a comment" # comment\n'
+            "CORS_ALLOW_ORIGINS=http://a#b\n",
+        )
+        self.assertEqual(
+            self.app_settings._read_env_file(path),
+            {
+                "supabase_url": "https://example.supabase.co",
+                "supabase_bucket": "docs",
+                "supabase_anon_key": "anon # not a comment",
+                "cors_allow_origins": "http://a#b",
+            },
+        )
+
+    def test_missing_file_is_empty(self):
+        self.assertEqual(self.app_settings._read_env_file(os.path.join(self.tmp.name, "nope.env")), {})
+
+    def test_later_files_and_environment_take_precedence(self):
+        root = self._write("root.env", "SUPABASE_BUCKET=root\nSIGNED_URL_EXPIRES_SECONDS=60\nSUPABASE_URL=root-url\n")
+        backend = self._write("backend.env", "SUPABASE_BUCKET=backend\n")
+        env = {"SUPABASE_URL": "env-url"}
+        with mock.patch.object(self.app_settings, "_ENV_CANDIDATES", [root, backend]), mock.patch.dict(
+            os.environ, env, clear=True
+        ):
+            s = self.app_settings._load_settings()
+        self.assertEqual(s.supabase_bucket, "backend")
+        self.assertEqual(s.supabase_url, "env-url")
+        self.assertEqual(s.signed_url_expires_seconds, 60)
+
+
+if __name__ == "__main__":
+    unittest.main()
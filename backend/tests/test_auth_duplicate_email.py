@@ -8,8 +8,15 @@ class FakeUser:
         self.email = email
 
 
+class FakeAuthApiError(Exception):
+    def __init__(self, message: str, status: int, code: str):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+
+
 class FakeAdmin:
-    def __init__(self, users=None, create_user_error: str | None = None):
+    def __init__(self, users=None, create_user_error: str | Exception | None = None):
         self._users = users or []
         self._create_user_error = create_user_error
         self.create_user_called = False
@@ -19,6 +26,8 @@ class FakeAdmin:
 
     def create_user(self, attributes):
         self.create_user_called = True
+        if isinstance(self._create_user_error, Exception):
+            raise self._create_user_error
         if self._create_user_error:
             raise Exception(self._create_user_error)
 
@@ -43,6 +52,26 @@ class FakeService:
         self.auth = FakeAuth(admin)
 
 
+class FakeRpcService(FakeService):
+    def __init__(self, admin: FakeAdmin, exists: bool):
+        super().__init__(admin)
+        self._exists = exists
+        self.rpc_calls = []
+
+    def rpc(self, fn, params):
+        self.rpc_calls.append((fn, params))
+        exists = self._exists
+
+        class Q:
+            def execute(self):
+                class R:
+                    data = exists
+
+                return R()
+
+        return Q()
+
+
 class FakeAnonAuth:
     def __init__(self, session_ok: bool = True, reset_error: str | None = None):
         self._session_ok = session_ok
@@ -79,10 +108,12 @@ class DuplicateEmailAuthTests(unittest.TestCase):
         self.main = main
         self._orig_get_service = main.get_supabase_service
         self._orig_get_anon = main.get_supabase_anon
+        main._email_exists_cache.clear()
 
     def tearDown(self):
         self.main.get_supabase_service = self._orig_get_service
         self.main.get_supabase_anon = self._orig_get_anon
+        self.main._email_exists_cache.clear()
 
     def test_email_availability_false_when_exists(self):
         admin = FakeAdmin(users=[FakeUser("exists@example.com")])
@@ -93,6 +124,44 @@ class DuplicateEmailAuthTests(unittest.TestCase):
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.json(), {"available": False})
 
+    def test_email_availability_uses_rpc_when_available(self):
+        admin = FakeAdmin(users=[])
+        svc = FakeRpcService(admin, exists=True)
+        self.main.get_supabase_service = lambda: svc
+        client = TestClient(self.main.app)
+
+        r = client.get("/api/auth/email-availability", params={"email": " Exists@Example.com "})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json(), {"available": False})
+        self.assertEqual(svc.rpc_calls, [("email_exists", {"p_email": "exists@example.com"})])
+
+    def test_email_availability_caches_registered_addresses(self):
+        admin = FakeAdmin(users=[])
+        svc = FakeRpcService(admin, exists=True)
+        self.main.get_supabase_service = lambda: svc
+        client = TestClient(self.main.app)
+
+        for _ in range(2):
+            r = client.get("/api/auth/email-availability", params={"email": "taken@example.com"})
+            self.assertEqual(r.json(), {"available": False})
+        self.assertEqual(len(svc.rpc_calls), 1)
+
+    def test_email_availability_sees_signup_from_another_worker(self):
+        admin = FakeAdmin(users=[])
+        svc = FakeRpcService(admin, exists=False)
+        self.main.get_supabase_service = lambda: svc
+        client = TestClient(self.main.app)
+
+        r = client.get("/api/auth/email-availability", params={"email": "race@example.com"})
+        self.assertEqual(r.json(), {"available": True})
+
+        # Another worker (or the dashboard) registers the address; this process must not
+        # keep answering "available" from memory.
+        svc._exists = True
+        r = client.get("/api/auth/email-availability", params={"email": "race@example.com"})
+        self.assertEqual(r.json(), {"available": False})
+        self.assertEqual(len(svc.rpc_calls), 2)
+
     def test_signup_returns_409_when_email_exists_precheck(self):
         admin = FakeAdmin(users=[FakeUser("dup@example.com")])
         anon_auth = FakeAnonAuth(session_ok=True)
@@ -117,6 +186,17 @@ class DuplicateEmailAuthTests(unittest.TestCase):
         self.assertEqual(r.json()["detail"]["code"], "duplicate_email")
         self.assertTrue(admin.create_user_called)
 
+    def test_signup_detects_duplicate_from_error_code(self):
+        admin = FakeAdmin(users=[], create_user_error=FakeAuthApiError("Email sudah terdaftar", 422, "email_exists"))
+        anon_auth = FakeAnonAuth(session_ok=True)
+        self.main.get_supabase_service = lambda: FakeService(admin)
+        self.main.get_supabase_anon = lambda: FakeAnon(anon_auth)
+        client = TestClient(self.main.app)
+
+        r = client.post("/api/auth/sign-up", json={"email": "dup3@example.com", "password": "Password123!"})
+        self.assertEqual(r.status_code, 409)
+        self.assertEqual(r.json()["detail"]["code"], "duplicate_email")
+
     def test_password_recovery_always_ok(self):
         admin = FakeAdmin(users=[])
         anon_auth = FakeAnonAuth(session_ok=True, reset_error="smtp down")
@@ -143,8 +223,10 @@ class DuplicateEmailAuthTests(unittest.TestCase):
         class Storage:
             def __init__(self):
                 self.created = False
+                self.list_calls = 0
 
             def list_buckets(self):
+                self.list_calls += 1
                 return []
 
             def create_bucket(self, bid: str, options=None, name=None):
@@ -155,10 +237,14 @@ class DuplicateEmailAuthTests(unittest.TestCase):
             def __init__(self):
                 self.storage = Storage()
 
+        self.main._buckets_ready.clear()
         svc = Svc()
         self.main._ensure_storage_bucket(svc)
         self.assertTrue(svc.storage.created)
 
+        self.main._ensure_storage_bucket(svc)
+        self.assertEqual(svc.storage.list_calls, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
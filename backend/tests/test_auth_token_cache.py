@@ -0,0 +1,64 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+
+class FakeAnonAuth:
+    def __init__(self, user_id: str | None = "user-1"):
+        self._user_id = user_id
+        self.get_user_calls = 0
+
+    def get_user(self, token: str):
+        self.get_user_calls += 1
+        user_id = self._user_id
+
+        class U:
+            id = user_id
+
+        class R:
+            user = U() if user_id else None
+
+        return R()
+
+
+class FakeAnon:
+    def __init__(self, auth: FakeAnonAuth):
+        self.auth = auth
+
+
+class AuthTokenCacheTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self._orig_get_anon = main.get_supabase_anon
+        main._auth_cache.clear()
+
+    def tearDown(self):
+        self.main.get_supabase_anon = self._orig_get_anon
+        self.main._auth_cache.clear()
+
+    def test_valid_token_is_checked_once(self):
+        auth = FakeAnonAuth()
+        self.main.get_supabase_anon = lambda: FakeAnon(auth)
+        client = TestClient(self.main.app)
+
+        for _ in range(3):
+            r = client.get("/api/me", headers={"Authorization": "Bearer tok-a"})
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.json(), {"user_id": "user-1"})
+        self.assertEqual(auth.get_user_calls, 1)
+
+    def test_invalid_token_is_not_cached(self):
+        auth = FakeAnonAuth(user_id=None)
+        self.main.get_supabase_anon = lambda: FakeAnon(auth)
+        client = TestClient(self.main.app)
+
+        for _ in range(2):
+            r = client.get("/api/me", headers={"Authorization": "Bearer tok-b"})
+            self.assertEqual(r.status_code, 401)
+        self.assertEqual(auth.get_user_calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+
+class FakeSigningStorage:
+    def __init__(self, batch_error: Exception | None = None):
+        self._batch_error = batch_error
+        self.batch_calls = []
+        self.single_calls = []
+
+    def create_signed_urls(self, paths, expires_in):
+        self.batch_calls.append(list(paths))
+        if self._batch_error is not None:
+            raise self._batch_error
+        return [{"path": p, "signedURL": f"https://signed/{p}", "error": None} for p in paths]
+
+    def create_signed_url(self, path, expires_in):
+        self.single_calls.append(path)
+        return {"signedURL": f"https://single/{path}"}
+
+
+class SignedUrlTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        main._signed_url_cache.clear()
+
+    def tearDown(self):
+        self.main._signed_url_cache.clear()
+
+    def test_signs_missing_paths_in_one_batch_and_caches(self):
+        storage = FakeSigningStorage()
+        out = self.main._signed_urls(storage, ["a.pdf", "b.pdf", "a.pdf"])
+        self.assertEqual(out, {"a.pdf": "https://signed/a.pdf", "b.pdf": "https://signed/b.pdf"})
+        self.assertEqual(storage.batch_calls, [["a.pdf", "b.pdf"]])
+
+        out = self.main._signed_urls(storage, ["b.pdf", "c.pdf"])
+        self.assertEqual(out["b.pdf"], "https://signed/b.pdf")
+        self.assertEqual(storage.batch_calls[1], ["c.pdf"])
+
+    def test_falls_back_to_one_by_one_when_batch_fails(self):
+        storage = FakeSigningStorage(batch_error=Exception("batch endpoint down"))
+        out = self.main._signed_urls(storage, ["a.pdf", "b.pdf"])
+        self.assertEqual(out, {"a.pdf": "https://single/a.pdf", "b.pdf": "https://single/b.pdf"})
+        self.assertEqual(sorted(storage.single_calls), ["a.pdf", "b.pdf"])
+
+
+class MtoRowsCacheTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self._orig_ocr_call = main._ocr_call
+        self._orig_processes = main.OCR_PROCESSES
+        self.ocr_calls = []
+
+        def fake_ocr_call(fn, raw, *args, **kwargs):
+            self.ocr_calls.append(args)
+            page = args[0] if args else None
+            return [{"item": "1", "page": page}]
+
+        main._ocr_call = fake_ocr_call
+        main.OCR_PROCESSES = 0
+        main._mto_rows_cache.clear()
+
+    def tearDown(self):
+        self.main._ocr_call = self._orig_ocr_call
+        self.main.OCR_PROCESSES = self._orig_processes
+        self.main._mto_rows_cache.clear()
+
+    def test_same_file_and_options_run_ocr_once(self):
+        rows = self.main._extract_mto_rows(b"pdf", 0, bbox=None, split_columns=None)
+        rows[0]["flag"] = "edited"
+        again = self.main._extract_mto_rows(b"pdf", 0, bbox=None, split_columns=None)
+        self.assertEqual(again, [{"item": "1", "page": 0}])
+        self.assertEqual(len(self.ocr_calls), 1)
+
+    def test_other_options_are_separate_entries(self):
+        self.main._extract_mto_rows(b"pdf", 0, bbox=None, split_columns=None)
+        self.main._extract_mto_rows(b"pdf", 0, bbox=(1.0, 2.0, 3.0, 4.0), split_columns=None)
+        self.main._extract_mto_rows(b"pdf", 1, bbox=None, split_columns=None)
+        self.assertEqual(len(self.ocr_calls), 3)
+
+    def test_pages_reuse_cached_rows(self):
+        self.main._extract_mto_rows(b"pdf", 1, bbox=None, split_columns=None)
+        pages = self.main._extract_mto_pages(b"pdf", [0, 1, 2], bbox=None, split_columns=None)
+        self.assertEqual(sorted(pages), [0, 1, 2])
+        self.assertEqual(pages[2], [{"item": "1", "page": 2}])
+        self.assertEqual(len(self.ocr_calls), 3)
+
+    def test_page_indices_are_validated(self):
+        from fastapi import HTTPException
+
+        self.assertEqual(self.main._parse_page_indices("2, 0,2"), [2, 0])
+        for bad in ("", "a,b", "-1", ",".join(str(i) for i in range(self.main.MTO_MAX_PAGES + 1))):
+            with self.assertRaises(HTTPException):
+                self.main._parse_page_indices(bad)
+
+
+class FakeBucketStorage:
+    def __init__(self):
+        self.list_calls = 0
+
+    def list_buckets(self):
+        self.list_calls += 1
+        return []
+
+
+class FakeBucketService:
+    def __init__(self):
+        self.storage = FakeBucketStorage()
+
+
+class HealthCacheTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self._orig_get_service = main.get_supabase_service
+        self.svc = FakeBucketService()
+        main.get_supabase_service = lambda: self.svc
+        main._health_cache = None
+
+    def tearDown(self):
+        self.main.get_supabase_service = self._orig_get_service
+        self.main._health_cache = None
+
+    def test_storage_check_is_reused_briefly(self):
+        client = TestClient(self.main.app)
+        first = client.get("/api/health").json()
+        second = client.get("/api/health").json()
+        self.assertEqual(first, second)
+        self.assertFalse(first["ok"])
+        self.assertEqual(self.svc.storage.list_calls, 1)
+
+        self.main._health_cache = (self.main._health_cache[0] - self.main.HEALTH_CACHE_SECONDS - 1, first)
+        client.get("/api/health")
+        self.assertEqual(self.svc.storage.list_calls, 2)
+
+
+class DocumentCacheTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self.tmp = tempfile.TemporaryDirectory()
+        self._orig_dir = main.DOC_CACHE_DIR
+        self._orig_max = main.DOC_CACHE_MAX_BYTES
+        main.DOC_CACHE_DIR = Path(self.tmp.name) / "docs"
+
+    def tearDown(self):
+        self.main.DOC_CACHE_DIR = self._orig_dir
+        self.main.DOC_CACHE_MAX_BYTES = self._orig_max
+        self.tmp.cleanup()
+
+    def test_round_trip_uses_private_permissions(self):
+        self.main._store_cached_document("u/p/d/a.pdf", b"%PDF-1.4 data")
+        self.assertEqual(self.main._read_cached_document("u/p/d/a.pdf"), b"%PDF-1.4 data")
+        if os.name == "posix":
+            self.assertEqual(stat.S_IMODE(os.stat(self.main.DOC_CACHE_DIR).st_mode), 0o700)
+            path = self.main._doc_cache_path("u/p/d/a.pdf")
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+    def test_tampered_copy_is_a_miss(self):
+        self.main._store_cached_document("u/p/d/a.pdf", b"%PDF-1.4 data")
+        path = self.main._doc_cache_path("u/p/d/a.pdf")
+        path.write_bytes(path.read_bytes()[:-1] + b"X")
+        self.assertIsNone(self.main._read_cached_document("u/p/d/a.pdf"))
+        self.assertFalse(path.exists())
+
+    def test_planted_file_is_a_miss(self):
+        self.main.DOC_CACHE_DIR.mkdir(mode=0o700)
+        self.main._doc_cache_path("u/p/d/a.pdf").write_bytes(b"%PDF-1.4 evil")
+        self.assertIsNone(self.main._read_cached_document("u/p/d/a.pdf"))
+
+    @unittest.skipUnless(os.name == "posix", "permission bits")
+    def test_group_writable_dir_is_refused(self):
+        self.main.DOC_CACHE_DIR.mkdir()
+        os.chmod(self.main.DOC_CACHE_DIR, 0o777)
+        self.main._store_cached_document("u/p/d/a.pdf", b"%PDF-1.4 data")
+        self.assertEqual(os.listdir(self.main.DOC_CACHE_DIR), [])
+        self.assertIsNone(self.main._read_cached_document("u/p/d/a.pdf"))
+
+    def test_eviction_keeps_newest_within_budget(self):
+        self.main.DOC_CACHE_MAX_BYTES = 100
+        self.main._store_cached_document("a", b"x" * 40)
+        old = self.main._doc_cache_path("a")
+        os.utime(old, (1, 1))
+        self.main._store_cached_document("b", b"y" * 40)
+        self.assertFalse(old.exists())
+        self.assertEqual(self.main._read_cached_document("b"), b"y" * 40)
+
+
+class FakePytesseract:
+    def __init__(self, results):
+        self._results = list(results)
+        self.calls = 0
+
+    def get_tesseract_version(self):
+        self.calls += 1
+        result = self._results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class TesseractVersionTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self._orig_import = main._try_import_pytesseract
+        main._tesseract_version = None
+
+    def tearDown(self):
+        self.main._try_import_pytesseract = self._orig_import
+        self.main._tesseract_version = None
+
+    def test_failure_is_not_cached(self):
+        fake = FakePytesseract([OSError("tesseract not found"), "5.3.0"])
+        self.main._try_import_pytesseract = lambda: fake
+        self.assertIsNone(self.main._tesseract_engine_version())
+        self.assertEqual(self.main._tesseract_engine_version(), "5.3.0")
+        self.assertEqual(self.main._tesseract_engine_version(), "5.3.0")
+        self.assertEqual(fake.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
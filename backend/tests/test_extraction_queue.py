@@ -0,0 +1,207 @@
+import unittest
+
+from fastapi.testclient import TestClient
+
+
+DOC = {
+    "id": "doc-1",
+    "owner_id": "user-1",
+    "project_id": "proj-1",
+    "storage_path": "user-1/proj-1/doc-1/a.pdf",
+    "filename": "a.pdf",
+    "status": "uploaded",
+    "file_kind": "pdf",
+}
+
+
+class FakeApiError(Exception):
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeQuery:
+    def __init__(self, svc: "FakeService", table: str, op: str, payload=None):
+        self._svc = svc
+        self._table = table
+        self._op = op
+        self._payload = payload
+        self._filters = []
+
+    def select(self, *_args, **_kwargs):
+        return self
+
+    def eq(self, col, value):
+        self._filters.append(("eq", col, value))
+        return self
+
+    def in_(self, col, values):
+        self._filters.append(("in", col, list(values)))
+        return self
+
+    def limit(self, _n):
+        return self
+
+    def execute(self):
+        self._svc.calls.append((self._table, self._op, self._payload, self._filters))
+
+        class R:
+            data = list(self._svc.rows.get((self._table, self._op), []))
+
+        return R()
+
+
+class FakeTable:
+    def __init__(self, svc: "FakeService", name: str):
+        self._svc = svc
+        self._name = name
+
+    def select(self, *_args, **_kwargs):
+        return FakeQuery(self._svc, self._name, "select")
+
+    def insert(self, payload, **_kwargs):
+        return FakeQuery(self._svc, self._name, "insert", payload)
+
+    def update(self, payload, **_kwargs):
+        return FakeQuery(self._svc, self._name, "update", payload)
+
+
+class FakeService:
+    def __init__(self, claim=None):
+        # claim: list -> RPC result rows, FakeApiError -> RPC unavailable (pre-0013 database).
+        self._claim = claim
+        self.calls = []
+        self.rpc_calls = []
+        self.rows = {("documents", "select"): [dict(DOC)], ("extraction_runs", "insert"): [{}]}
+
+    def table(self, name: str):
+        return FakeTable(self, name)
+
+    def rpc(self, fn, params):
+        self.rpc_calls.append((fn, params))
+        claim = self._claim
+
+        class Q:
+            def execute(self):
+                if isinstance(claim, Exception):
+                    raise claim
+
+                class R:
+                    data = claim
+
+                return R()
+
+        return Q()
+
+    def run_updates(self):
+        return [(payload, filters) for table, op, payload, filters in self.calls if (table, op) == ("extraction_runs", "update")]
+
+
+class ExtractionQueueTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self._orig_get_service = main.get_supabase_service
+        self._orig_run = main._run_extraction
+        main.app.dependency_overrides[main._require_auth] = lambda: "user-1"
+        self.runs = []
+        self.run_error: Exception | None = None
+
+        def fake_run(svc, d, document_id, user_id, run_id, *, marked=False):
+            self.runs.append({"document_id": document_id, "run_id": run_id, "marked": marked})
+            if self.run_error is not None:
+                raise self.run_error
+            return {
+                "run": {
+                    "id": run_id,
+                    "owner_id": user_id,
+                    "document_id": document_id,
+                    "method": "pdf_text",
+                    "status": "success",
+                    "extracted_json": None,
+                    "notes": None,
+                    "created_at": "2026-01-01T00:00:00+00:00",
+                },
+                "inserted_materials": 3,
+            }
+
+        main._run_extraction = fake_run
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.main.get_supabase_service = self._orig_get_service
+        self.main._run_extraction = self._orig_run
+        self.main.app.dependency_overrides.clear()
+
+    def _use(self, svc: FakeService) -> FakeService:
+        self.main.get_supabase_service = lambda: svc
+        return svc
+
+    def test_background_extract_queues_then_runs(self):
+        svc = self._use(FakeService())
+
+        r = self.client.post("/api/documents/doc-1/extract", params={"background": "true"})
+        self.assertEqual(r.status_code, 202)
+        body = r.json()
+        self.assertEqual(body["inserted_materials"], 0)
+        self.assertEqual(body["run"]["status"], "queued")
+        run_id = body["run"]["id"]
+
+        (queued,) = [p for t, op, p, _ in svc.calls if (t, op) == ("extraction_runs", "insert")]
+        self.assertEqual(queued["status"], "queued")
+        self.assertEqual(queued["id"], run_id)
+        # The background task marks the run running and hands it to the extractor.
+        self.assertEqual(svc.run_updates(), [({"status": "running"}, [("eq", "id", run_id)])])
+        self.assertEqual(self.runs, [{"document_id": "doc-1", "run_id": run_id, "marked": False}])
+        self.assertEqual(svc.rpc_calls, [])
+
+    def test_background_failure_marks_pending_run_failed(self):
+        svc = self._use(FakeService())
+        self.run_error = RuntimeError("download gagal")
+
+        r = self.client.post("/api/documents/doc-1/extract", params={"background": "true"})
+        self.assertEqual(r.status_code, 202)
+        run_id = r.json()["run"]["id"]
+
+        updates = svc.run_updates()
+        self.assertEqual(updates[0], ({"status": "running"}, [("eq", "id", run_id)]))
+        self.assertEqual(
+            updates[1],
+            (
+                {"status": "failed", "notes": "download gagal"},
+                [("eq", "id", run_id), ("in", "status", ["queued", "running"])],
+            ),
+        )
+
+    def test_sync_extract_uses_claim_rpc(self):
+        svc = self._use(FakeService(claim=[dict(DOC)]))
+
+        r = self.client.post("/api/documents/doc-1/extract")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["inserted_materials"], 3)
+        self.assertEqual(
+            svc.rpc_calls,
+            [("claim_document", {"p_document": "doc-1", "p_owner": "user-1", "p_status": "extracting"})],
+        )
+        self.assertTrue(self.runs[0]["marked"])
+        self.assertFalse([c for c in svc.calls if c[0] == "documents"])
+
+    def test_sync_extract_falls_back_without_claim_rpc(self):
+        svc = self._use(FakeService(claim=FakeApiError("function public.claim_document does not exist", "42883")))
+
+        r = self.client.post("/api/documents/doc-1/extract")
+        self.assertEqual(r.status_code, 200)
+        self.assertFalse(self.runs[0]["marked"])
+        self.assertEqual([c[:2] for c in svc.calls], [("documents", "select")])
+
+    def test_sync_extract_404_when_claim_finds_nothing(self):
+        self._use(FakeService(claim=[]))
+
+        r = self.client.post("/api/documents/doc-1/extract")
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(self.runs, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
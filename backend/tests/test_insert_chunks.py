@@ -0,0 +1,70 @@
+import unittest
+
+
+class FakeMinimalResponse:
+    # What postgrest-py 0.18 builds for `Prefer: return=minimal`: empty body, count forced to 0.
+    data: list = []
+    count = 0
+
+
+class FakeInsertQuery:
+    def __init__(self, table: "FakeTable", rows, kwargs):
+        self._table = table
+        self._rows = rows
+        self._kwargs = kwargs
+
+    def execute(self):
+        self._table.inserts.append((list(self._rows), self._kwargs))
+        return FakeMinimalResponse()
+
+
+class FakeTable:
+    def __init__(self):
+        self.inserts = []
+
+    def insert(self, rows, **kwargs):
+        return FakeInsertQuery(self, rows, kwargs)
+
+
+class FakeService:
+    def __init__(self):
+        self.tables: dict[str, FakeTable] = {}
+
+    def table(self, name: str):
+        return self.tables.setdefault(name, FakeTable())
+
+
+class InsertChunksTests(unittest.TestCase):
+    def setUp(self):
+        import backend.db as db
+
+        self.db = db
+
+    def test_minimal_insert_counts_sent_rows(self):
+        svc = FakeService()
+        rows = [{"id": str(i)} for i in range(3)]
+
+        self.assertEqual(self.db.insert_chunk(svc, "materials", rows, "gagal"), 3)
+        (sent, kwargs), = svc.tables["materials"].inserts
+        self.assertEqual(sent, rows)
+        self.assertEqual(kwargs.get("returning"), "minimal")
+
+    def test_large_insert_sums_every_slice(self):
+        svc = FakeService()
+        n = self.db.INSERT_CHUNK_SIZE * 2 + 7
+        rows = [{"id": str(i)} for i in range(n)]
+
+        self.assertEqual(self.db.insert_rows_minimal(svc, "materials", rows), n)
+        self.assertEqual(len(svc.tables["materials"].inserts), 3)
+
+    def test_submitted_chunks_report_row_counts(self):
+        svc = FakeService()
+        n = self.db.INSERT_CHUNK_SIZE + 1
+        rows = [{"id": str(i)} for i in range(n)]
+
+        jobs = self.db.submit_insert_chunks(svc, "ocr_item_extractions", rows)
+        self.assertEqual(sum(job.result() for job in jobs), n)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+
+from fastapi.testclient import TestClient
+
+
+class MtoJobTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self._orig_extract = main._extract_mto_rows
+        self._orig_slots = main._mto_job_slots
+        self._orig_max_bytes = main.UPLOAD_MAX_BYTES
+        self._orig_max_results = main.MTO_JOB_MAX_RESULTS
+        self.user_id = "user-1"
+        main.app.dependency_overrides[main._require_auth] = lambda: self.user_id
+        main._mto_jobs.clear()
+        self.release = threading.Event()
+        self.calls = []
+
+        def fake_extract(raw, page_index, *, bbox, split_columns):
+            self.calls.append((raw, page_index, bbox, split_columns))
+            self.release.wait(5)
+            return [{"item": "1", "description": "PIPE"}]
+
+        main._extract_mto_rows = fake_extract
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        self.release.set()
+        self.main._extract_mto_rows = self._orig_extract
+        self.main._mto_job_slots = self._orig_slots
+        self.main.UPLOAD_MAX_BYTES = self._orig_max_bytes
+        self.main.MTO_JOB_MAX_RESULTS = self._orig_max_results
+        self.main.app.dependency_overrides.clear()
+        self.main._mto_jobs.clear()
+
+    def _submit(self, data=b"%PDF-1.4 test"):
+        return self.client.post(
+            "/api/mto/async",
+            files={"pdf": ("a.pdf", data, "application/pdf")},
+            data={"page_index": "2", "bbox": "1,2,3,4"},
+        )
+
+    def _job(self, job_id):
+        return self.main._mto_jobs[job_id].future
+
+    def test_submit_then_poll_until_done(self):
+        r = self._submit()
+        self.assertEqual(r.status_code, 202)
+        job_id = r.json()["job_id"]
+        self.assertEqual(r.json()["status"], "running")
+
+        r = self.client.get(f"/api/mto/jobs/{job_id}")
+        self.assertEqual(r.json(), {"job_id": job_id, "status": "running"})
+
+        self.release.set()
+        self._job(job_id).result(timeout=5)
+        r = self.client.get(f"/api/mto/jobs/{job_id}")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["status"], "done")
+        self.assertEqual(r.json()["items"], [{"item": "1", "description": "PIPE"}])
+        self.assertEqual(self.calls, [(b"%PDF-1.4 test", 2, (1.0, 2.0, 3.0, 4.0), None)])
+
+    def test_failed_job_reports_detail(self):
+        def failing(raw, page_index, *, bbox, split_columns):
+            raise RuntimeError("tesseract hilang")
+
+        self.main._extract_mto_rows = failing
+        job_id = self._submit().json()["job_id"]
+        with self.assertRaises(RuntimeError):
+            self._job(job_id).result(timeout=5)
+
+        r = self.client.get(f"/api/mto/jobs/{job_id}")
+        self.assertEqual(r.json(), {"job_id": job_id, "status": "failed", "detail": "tesseract hilang"})
+
+    def test_job_is_private_to_its_owner(self):
+        job_id = self._submit().json()["job_id"]
+        self.user_id = "user-2"
+        r = self.client.get(f"/api/mto/jobs/{job_id}")
+        self.assertEqual(r.status_code, 404)
+
+    def test_unknown_job_is_404(self):
+        r = self.client.get("/api/mto/jobs/nope")
+        self.assertEqual(r.status_code, 404)
+
+    def test_full_queue_is_rejected(self):
+        self.main._mto_job_slots = threading.BoundedSemaphore(1)
+        self.assertEqual(self._submit().status_code, 202)
+
+        r = self._submit()
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(r.headers.get("retry-after"), "30")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_slot_is_freed_when_job_finishes(self):
+        self.main._mto_job_slots = threading.BoundedSemaphore(1)
+        job_id = self._submit().json()["job_id"]
+        self.release.set()
+        self._job(job_id).result(timeout=5)
+
+        self.assertEqual(self._submit().status_code, 202)
+
+    def test_oversized_upload_is_rejected(self):
+        self.main.UPLOAD_MAX_BYTES = 4
+        r = self._submit()
+        self.assertEqual(r.status_code, 413)
+        self.assertEqual(self.calls, [])
+
+    def test_requires_auth(self):
+        self.main.app.dependency_overrides.clear()
+        r = self._submit()
+        self.assertEqual(r.status_code, 401)
+
+    def _entry(self, finished_at=None):
+        job = Future()
+        if finished_at is not None:
+            job.set_result([])
+        return self.main._MtoJob("user-1", job, finished_at)
+
+    def test_sweep_never_drops_pending_jobs(self):
+        self.main.MTO_JOB_MAX_RESULTS = 1
+        now = time.monotonic()
+        jobs = self.main._mto_jobs
+        jobs["pending"] = self._entry()
+        jobs["old"] = self._entry(now - 3)
+        jobs["older"] = self._entry(now - 5)
+        jobs["newest"] = self._entry(now - 1)
+        with self.main._mto_jobs_lock:
+            self.main._sweep_mto_jobs(now)
+        self.assertEqual(sorted(jobs), ["newest", "pending"])
+
+    def test_results_expire_from_completion(self):
+        now = time.monotonic()
+        ttl = self.main.MTO_JOB_RESULT_SECONDS
+        jobs = self.main._mto_jobs
+        jobs["long_running"] = self._entry()
+        jobs["fresh"] = self._entry(now - ttl + 5)
+        jobs["stale"] = self._entry(now - ttl - 5)
+        with self.main._mto_jobs_lock:
+            self.main._sweep_mto_jobs(now)
+        self.assertEqual(sorted(jobs), ["fresh", "long_running"])
+
+    def test_finished_job_records_completion(self):
+        job_id = self._submit().json()["job_id"]
+        self.assertIsNone(self.main._mto_jobs[job_id].finished_at)
+        self.release.set()
+        self._job(job_id).result(timeout=5)
+        deadline = time.monotonic() + 5
+        while self.main._mto_jobs[job_id].finished_at is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertIsNotNone(self.main._mto_jobs[job_id].finished_at)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+
+class FakeApiError(Exception):
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeRpcService:
+    def __init__(self, result=None, error: Exception | None = None):
+        self._result = result
+        self._error = error
+        self.rpc_calls = []
+
+    def rpc(self, fn, params):
+        self.rpc_calls.append((fn, params))
+        result, error = self._result, self._error
+
+        class Q:
+            def execute(self):
+                if error is not None:
+                    raise error
+
+                class R:
+                    data = result
+
+                return R()
+
+        return Q()
+
+
+class FakeQuery:
+    def __init__(self, data, error: Exception | None = None):
+        self._data = data
+        self._error = error
+
+    def select(self, *_args, **_kwargs):
+        return self
+
+    def update(self, *_args, **_kwargs):
+        return self
+
+    def insert(self, *_args, **_kwargs):
+        return self
+
+    def eq(self, *_args):
+        return self
+
+    def order(self, *_args, **_kwargs):
+        return self
+
+    def limit(self, _n):
+        return self
+
+    def execute(self):
+        if self._error is not None:
+            raise self._error
+        data = self._data
+
+        class R:
+            pass
+
+        r = R()
+        r.data = data
+        return r
+
+
+class FakeTableService:
+    def __init__(self, tables: dict, errors: dict | None = None):
+        self._tables = tables
+        self._errors = errors or {}
+        self.queried = []
+
+    def table(self, name: str):
+        self.queried.append(name)
+        return FakeQuery(self._tables.get(name, []), self._errors.get(name))
+
+
+class FakeRpcTableService(FakeRpcService):
+    def __init__(self, tables: dict, **kwargs):
+        super().__init__(**kwargs)
+        self._tables = FakeTableService(tables)
+        self.queried = self._tables.queried
+
+    def table(self, name: str):
+        return self._tables.table(name)
+
+
+class ReplaceDocumentMaterialsTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self.rows = [{"id": "m1"}, {"id": "m2"}]
+
+    def test_uses_rpc_count(self):
+        svc = FakeRpcService(result=2)
+        self.assertEqual(self.main._replace_document_materials(svc, "doc-1", "user-1", self.rows, "ocr"), 2)
+        self.assertEqual(
+            svc.rpc_calls,
+            [
+                (
+                    "replace_document_materials",
+                    {"p_document": "doc-1", "p_owner": "user-1", "p_source": "ocr", "p_rows": self.rows},
+                )
+            ],
+        )
+
+    def test_counts_rows_when_rpc_returns_no_number(self):
+        svc = FakeRpcService(result=None)
+        self.assertEqual(self.main._replace_document_materials(svc, "doc-1", "user-1", self.rows), 2)
+
+    def test_none_when_rpc_is_unavailable(self):
+        svc = FakeRpcService(error=FakeApiError("function replace_document_materials does not exist", "42883"))
+        self.assertIsNone(self.main._replace_document_materials(svc, "doc-1", "user-1", self.rows))
+
+    def test_other_rpc_errors_are_raised(self):
+        svc = FakeRpcService(error=TimeoutError("read timeout"))
+        with self.assertRaises(TimeoutError):
+            self.main._replace_document_materials(svc, "doc-1", "user-1", self.rows)
+
+
+class ClaimDocumentTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+
+    def test_returns_row_before_the_flip(self):
+        svc = FakeRpcService(result=[{"id": "doc-1", "status": "uploaded"}])
+        self.assertEqual(
+            self.main._claim_document(svc, "doc-1", "user-1", "extracting"), {"id": "doc-1", "status": "uploaded"}
+        )
+
+    def test_none_when_rpc_is_unavailable(self):
+        svc = FakeRpcService(error=FakeApiError("Could not find the function public.claim_document", "PGRST202"))
+        self.assertIsNone(self.main._claim_document(svc, "doc-1", "user-1", "extracting"))
+
+    def test_other_rpc_errors_are_raised(self):
+        svc = FakeRpcService(error=ConnectionError("connection reset"))
+        with self.assertRaises(ConnectionError):
+            self.main._claim_document(svc, "doc-1", "user-1", "extracting")
+
+    def test_404_when_not_owned(self):
+        from fastapi import HTTPException
+
+        svc = FakeRpcService(result=[])
+        with self.assertRaises(HTTPException) as ctx:
+            self.main._claim_document(svc, "doc-1", "user-2", "extracting")
+        self.assertEqual(ctx.exception.status_code, 404)
+
+
+class RecentMtoImportTests(unittest.TestCase):
+    PARAMS = {"page_index": 0, "bbox": None, "split_columns": None}
+
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+        self.doc = {"id": "doc-1", "project_id": "proj-1", "last_ocr_run_id": "run-1"}
+
+    def _svc(self, *, age_seconds: float, params=None, sha="abc"):
+        processed_at = datetime.now(timezone.utc) - timedelta(seconds=age_seconds)
+        run = {"id": "run-1", "params": params or self.PARAMS, "content_sha256": sha, "processed_at": processed_at.isoformat()}
+        exts = [
+            {"raw_payload": {"item": "1"}, "flags": {"needs_review": True}},
+            {"raw_payload": {"item": "2"}, "flags": {"needs_review": False}},
+        ]
+        return FakeTableService({"ocr_runs": [run], "ocr_item_extractions": exts})
+
+    def test_reuses_recent_identical_run(self):
+        svc = self._svc(age_seconds=5)
+        out = self.main._recent_mto_import(svc, self.doc, "user-1", self.PARAMS, "abc")
+        self.assertTrue(out["reused"])
+        self.assertEqual(out["items"], [{"item": "1"}, {"item": "2"}])
+        self.assertEqual(out["inserted_materials"], 2)
+        self.assertEqual(out["flagged"], 1)
+
+    def test_ignores_run_outside_window(self):
+        svc = self._svc(age_seconds=self.main.MTO_IMPORT_REUSE_SECONDS + 30)
+        self.assertIsNone(self.main._recent_mto_import(svc, self.doc, "user-1", self.PARAMS, "abc"))
+
+    def test_ignores_other_file_or_options(self):
+        svc = self._svc(age_seconds=5, sha="other")
+        self.assertIsNone(self.main._recent_mto_import(svc, self.doc, "user-1", self.PARAMS, "abc"))
+        svc = self._svc(age_seconds=5, params={**self.PARAMS, "page_index": 3})
+        self.assertIsNone(self.main._recent_mto_import(svc, self.doc, "user-1", self.PARAMS, "abc"))
+
+    def test_no_lookup_without_previous_run(self):
+        svc = self._svc(age_seconds=5)
+        self.assertIsNone(self.main._recent_mto_import(svc, {"id": "doc-1"}, "user-1", self.PARAMS, "abc"))
+        self.assertEqual(svc.queried, [])
+
+
+class UpdateMaterialTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+        from backend.schemas import MaterialUpdate
+
+        self.main = main
+        self.payload = MaterialUpdate(quantity=3)
+        self._orig_get_service = main.get_supabase_service
+
+    def tearDown(self):
+        self.main.get_supabase_service = self._orig_get_service
+
+    def _use(self, svc):
+        self.main.get_supabase_service = lambda: svc
+        return svc
+
+    def test_uses_rpc_row(self):
+        svc = self._use(FakeRpcTableService({}, result=[{"id": "m1", "quantity": 3}]))
+        self.assertEqual(self.main.update_material("m1", self.payload, user_id="user-1"), {"id": "m1", "quantity": 3})
+        self.assertEqual(svc.queried, [])
+
+    def test_falls_back_when_rpc_is_missing(self):
+        svc = self._use(
+            FakeRpcTableService(
+                {"materials": [{"id": "m1", "project_id": "proj-1", "quantity": 3}]},
+                error=FakeApiError("Could not find the function public.edit_material", "PGRST202"),
+            )
+        )
+        self.assertEqual(self.main.update_material("m1", self.payload, user_id="user-1")["id"], "m1")
+        self.assertEqual(svc.queried, ["materials", "materials", "item_revisions"])
+
+    def test_other_rpc_errors_do_not_reapply_the_edit(self):
+        svc = self._use(FakeRpcTableService({}, error=ConnectionError("connection reset")))
+        with self.assertRaises(ConnectionError):
+            self.main.update_material("m1", self.payload, user_id="user-1")
+        self.assertEqual(svc.queried, [])
+
+
+class ConvertedDocumentTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+
+    def test_returns_matching_row(self):
+        svc = FakeTableService({"documents": [{"id": "doc-2"}]})
+        self.assertEqual(self.main._converted_document(svc, "user-1", "proj-1", "abc"), {"id": "doc-2"})
+
+    def test_none_without_hash_column(self):
+        svc = FakeTableService({}, {"documents": FakeApiError("column documents.source_sha256 does not exist", "42703")})
+        self.assertIsNone(self.main._converted_document(svc, "user-1", "proj-1", "abc"))
+
+    def test_other_errors_are_raised(self):
+        svc = FakeTableService({}, {"documents": FakeApiError("timeout", "57014")})
+        with self.assertRaises(FakeApiError):
+            self.main._converted_document(svc, "user-1", "proj-1", "abc")
+        svc = FakeTableService({}, {"documents": ConnectionError("reset")})
+        with self.assertRaises(ConnectionError):
+            self.main._converted_document(svc, "user-1", "proj-1", "abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
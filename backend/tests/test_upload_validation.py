@@ -1,4 +1,5 @@
 import io
+import tempfile
 import unittest
 
 from PIL import Image
@@ -75,5 +76,34 @@ class UploadValidationTests(unittest.TestCase):
         self.assertTrue(pdf.lstrip().startswith(b"%PDF-"))
 
 
+class FakeUploadStorage:
+    def __init__(self):
+        self.uploads = []
+
+    def upload(self, path, fh, options):
+        self.uploads.append((path, type(fh).__name__, fh.read()))
+
+
+class StreamingUploadTests(unittest.TestCase):
+    def setUp(self):
+        import backend.main as main
+
+        self.main = main
+
+    def test_in_memory_spool_streams_from_a_real_file(self):
+        src = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        src.write(b"%PDF-1.7 small")
+        src.seek(0)
+        storage = FakeUploadStorage()
+        self.main._upload_file_streaming(storage, "u/p/d/a.pdf", src, "application/pdf")
+        self.assertEqual(storage.uploads, [("u/p/d/a.pdf", "BufferedReader", b"%PDF-1.7 small")])
+        src.close()
+
+    def test_source_without_descriptor_is_copied(self):
+        storage = FakeUploadStorage()
+        self.main._upload_file_streaming(storage, "u/p/d/a.pdf", io.BytesIO(b"%PDF-1.7 bytes"), "application/pdf")
+        self.assertEqual(storage.uploads, [("u/p/d/a.pdf", "BufferedReader", b"%PDF-1.7 bytes")])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,16 @@
+-- GoTrue stores emails lowercased, so comparing against lower(p_email) stays on the
+-- existing auth.users email index instead of scanning the user directory page by page.
+create or replace function public.email_exists(p_email text)
+returns boolean
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+  select exists (
+    select 1 from auth.users u where u.email = lower(trim(p_email))
+  );
+$$;
+
+revoke all on function public.email_exists(text) from public, anon, authenticated;
+grant execute on function public.email_exists(text) to service_role;
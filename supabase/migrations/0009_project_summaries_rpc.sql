@@ -0,0 +1,32 @@
+-- Per-project dashboard counters computed in the database, so list_projects no longer
+-- downloads every document and material row of the user just to count them.
+create index if not exists materials_project_owner_idx on public.materials(project_id, owner_id);
+
+create or replace function public.project_summaries(p_owner uuid)
+returns table (
+  project_id uuid,
+  total_documents bigint,
+  total_material_rows bigint,
+  total_pipe_length_m double precision
+)
+language sql
+stable
+set search_path = ''
+as $$
+  select
+    p.id,
+    (select count(*) from public.documents d where d.project_id = p.id and d.owner_id = p_owner),
+    (select count(*) from public.materials m where m.project_id = p.id and m.owner_id = p_owner),
+    (
+      select coalesce(sum(m.quantity), 0)
+      from public.materials m
+      where m.project_id = p.id
+        and m.owner_id = p_owner
+        and lower(m.unit) in ('m', 'meter', 'meters')
+    )
+  from public.projects p
+  where p.owner_id = p_owner;
+$$;
+
+revoke all on function public.project_summaries(uuid) from public, anon, authenticated;
+grant execute on function public.project_summaries(uuid) to service_role;
@@ -0,0 +1,7 @@
+-- list_materials_page filters with ilike '%q%' on description/spec (and size); trigram GIN
+-- indexes let Postgres answer those without a sequential scan of materials.
+create extension if not exists pg_trgm;
+
+create index if not exists materials_description_trgm_idx on materials using gin (description gin_trgm_ops);
+create index if not exists materials_spec_trgm_idx on materials using gin (spec gin_trgm_ops);
+create index if not exists materials_size_trgm_idx on materials using gin (size gin_trgm_ops);
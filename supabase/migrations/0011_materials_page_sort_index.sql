@@ -0,0 +1,7 @@
+-- list_materials_page filters by project_id + owner_id and sorts by created_at desc by default;
+-- one composite index serves both the filter and the ordered LIMIT/OFFSET without a sort step.
+-- It also covers the (project_id, owner_id) prefix, so the narrower index from 0009 is dropped.
+create index if not exists materials_project_owner_created_idx
+  on public.materials(project_id, owner_id, created_at desc);
+
+drop index if exists public.materials_project_owner_idx;
@@ -0,0 +1,76 @@
+-- Manual material edits used three round-trips (select, update, insert revision) and could
+-- lose the revision row if the last one failed. This applies the patch and records the
+-- revision in one transaction; keys absent from p_patch keep their current value.
+create or replace function public.edit_material(p_material uuid, p_owner uuid, p_patch jsonb)
+returns setof public.materials
+language plpgsql
+set search_path = ''
+as $$
+declare
+  v_before public.materials;
+  v_patched public.materials;
+  v_after public.materials;
+begin
+  select * into v_before
+  from public.materials m
+  where m.id = p_material and m.owner_id = p_owner
+  for update;
+  if not found then
+    return;
+  end if;
+
+  v_patched := jsonb_populate_record(v_before, p_patch);
+
+  update public.materials m set
+    description = v_patched.description,
+    size = v_patched.size,
+    quantity = v_patched.quantity,
+    unit = v_patched.unit,
+    heat_no = v_patched.heat_no,
+    tag_no = v_patched.tag_no,
+    spec = v_patched.spec,
+    data_source = v_patched.data_source,
+    verification_status = v_patched.verification_status,
+    needs_review = v_patched.needs_review
+  where m.id = p_material and m.owner_id = p_owner
+  returning * into v_after;
+
+  insert into public.item_revisions (
+    owner_id, project_id, document_id, material_id, change_source,
+    before, after, ocr_run_id, ocr_extraction_id, changed_by
+  )
+  values (
+    p_owner,
+    v_after.project_id,
+    v_after.document_id,
+    p_material,
+    'manual_edit',
+    jsonb_build_object(
+      'description', v_before.description,
+      'spec', v_before.spec,
+      'size', v_before.size,
+      'quantity', v_before.quantity,
+      'unit', v_before.unit,
+      'verification_status', v_before.verification_status,
+      'needs_review', v_before.needs_review
+    ),
+    jsonb_build_object(
+      'description', v_after.description,
+      'spec', v_after.spec,
+      'size', v_after.size,
+      'quantity', v_after.quantity,
+      'unit', v_after.unit,
+      'verification_status', v_after.verification_status,
+      'needs_review', v_after.needs_review
+    ),
+    v_after.ocr_run_id,
+    v_after.ocr_extraction_id,
+    p_owner
+  );
+
+  return next v_after;
+end;
+$$;
+
+revoke all on function public.edit_material(uuid, uuid, jsonb) from public, anon, authenticated;
+grant execute on function public.edit_material(uuid, uuid, jsonb) to service_role;
@@ -0,0 +1,21 @@
+-- extract_document read the document and then flipped it to 'extracting' in a second request.
+-- This does both in one statement and returns the row as it was before the update, so the
+-- caller can still validate it and restore the previous status if extraction cannot start.
+create or replace function public.claim_document(p_document uuid, p_owner uuid, p_status text)
+returns setof public.documents
+language sql
+set search_path = ''
+as $$
+  update public.documents d
+  set status = p_status
+  from (
+    select * from public.documents
+    where id = p_document and owner_id = p_owner
+    for update
+  ) prev
+  where d.id = prev.id
+  returning prev.*;
+$$;
+
+revoke all on function public.claim_document(uuid, uuid, text) from public, anon, authenticated;
+grant execute on function public.claim_document(uuid, uuid, text) to service_role;
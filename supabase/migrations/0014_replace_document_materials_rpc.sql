@@ -0,0 +1,52 @@
+-- Re-extraction and MTO import cleared a document's materials and then inserted the new
+-- rows in separate requests, leaving a window where the document had no materials. This
+-- swaps them in one transaction. p_source limits the delete to one data_source (null = all).
+create or replace function public.replace_document_materials(
+  p_document uuid,
+  p_owner uuid,
+  p_source text,
+  p_rows jsonb
+)
+returns integer
+language plpgsql
+set search_path = ''
+as $$
+declare
+  v_inserted integer;
+begin
+  delete from public.materials m
+  where m.document_id = p_document
+    and m.owner_id = p_owner
+    and (p_source is null or m.data_source = p_source);
+
+  insert into public.materials (
+    id, owner_id, project_id, document_id, description, size, quantity, unit, heat_no, tag_no, spec,
+    created_at, data_source, verification_status, needs_review, ocr_run_id, ocr_extraction_id
+  )
+  select
+    coalesce(r.id, gen_random_uuid()),
+    p_owner,
+    r.project_id,
+    p_document,
+    r.description,
+    r.size,
+    r.quantity,
+    r.unit,
+    r.heat_no,
+    r.tag_no,
+    r.spec,
+    coalesce(r.created_at, now()),
+    coalesce(r.data_source, 'manual'),
+    coalesce(r.verification_status, 'draft'),
+    coalesce(r.needs_review, false),
+    r.ocr_run_id,
+    r.ocr_extraction_id
+  from jsonb_populate_recordset(null::public.materials, p_rows) r;
+
+  get diagnostics v_inserted = row_count;
+  return v_inserted;
+end;
+$$;
+
+revoke all on function public.replace_document_materials(uuid, uuid, text, jsonb) from public, anon, authenticated;
+grant execute on function public.replace_document_materials(uuid, uuid, text, jsonb) to service_role;
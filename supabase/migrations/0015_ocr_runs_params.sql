@@ -0,0 +1,5 @@
+-- Lets an MTO import recognise a retry of the run it just made (same file, same options)
+-- and return that run instead of running OCR and replacing the materials again.
+alter table ocr_runs
+  add column if not exists params jsonb,
+  add column if not exists content_sha256 text;
@@ -0,0 +1,8 @@
+-- convert-to-pdf records the SHA-256 of the source image it converted, so converting the
+-- same image again in the same project returns the earlier PDF instead of uploading a copy.
+alter table documents
+  add column if not exists source_sha256 text;
+
+create unique index if not exists documents_owner_project_source_sha256_idx
+  on public.documents(owner_id, project_id, source_sha256)
+  where source_sha256 is not null;